@@ -1,13 +1,34 @@
 # analysis.py
 
 from collections import defaultdict, Counter, deque
-from constants import TILE_NODES, NORTH, EAST, SOUTH, WEST
+from functools import lru_cache
+from constants import TILE_NODES, NUM_NODES, NORTH, EAST, SOUTH, WEST
 
 STAT_KEYS = [
     "houses", "ufos", "girls", "boys", "dogs", "hamburgers",
     "aliens", "agents", "captured_aliens", "curves"
 ]
 
+# Every stat returned by calculate_solution_stats, in the order it returns them
+SOLUTION_STAT_COLUMNS = [
+    "total_houses", "total_ufos", "total_girls", "total_boys", "total_dogs",
+    "total_hamburgers", "total_aliens", "total_agents", "total_captured_aliens",
+    "total_curves", "total_tiles_without_roads", "total_roads",
+    "max_aliens_running_towards_agent", "max_hamburgers_in_front_of_alien",
+    "max_agents_on_one_road", "max_aliens_on_one_road", "max_aliens_between_two_agents",
+    "total_food_chain_sets", "longest_road_size", "max_roads_of_same_length",
+    "aliens_times_ufos", "aliens_times_hamburgers", "citizen_dog_pairs",
+    "largest_dog_group", "largest_house_group", "largest_citizen_group",
+    "largest_safe_zone_size"
+]
+
+# The stats scored by the game cards: every solution stat but the plain ufo,
+# hamburger and alien totals (same order as SOLUTION_STAT_COLUMNS)
+CARD_STAT_COLUMNS = [
+    column for column in SOLUTION_STAT_COLUMNS
+    if column not in ("total_ufos", "total_hamburgers", "total_aliens")
+]
+
 # =============================================================================
 # SECTION 1: FUNÇÕES DE ESTATÍSTICAS INDIVIDUAIS
 # =============================================================================
@@ -168,6 +189,13 @@ def _calculate_max_aliens_between_agents(road, agents):
 # =============================================================================
 
 def _process_road_for_stats(road):
+    """
+    Per-road stats of a list of (item, direction). They only depend on the
+    sequence of non-empty items, so the evaluation is cached by road key.
+    """
+    return road_stats_for_key(encode_road(road))
+
+def _evaluate_road_stats(road):
     if not road: return {}
 
     all_items = {'alien': [], 'agent': [], 'hamburger': []}
@@ -322,31 +350,131 @@ def _build_all_roads_from_uf(solution, game_tiles, uf_structure):
         
     return all_roads
 
+# -----------------------------------------------------------------------------
+# Road fragments: compact, precomputed road records for every tile placement
+# -----------------------------------------------------------------------------
+
+# Non-empty road items are packed 3 bits each into an int, first item in the
+# lowest bits (0 is left free as the terminator). Empty segments are dropped:
+# no per-road stat depends on them. Agents and aliens take base code + 1 when
+# they face the direction in which the road is read.
+ITEM_BASE_CODES = {"hamburger": 1, "agent": 2, "alien": 4}
+ITEM_BY_CODE = {1: ("hamburger", -1), 2: ("agent", 0), 3: ("agent", 1), 4: ("alien", 0), 5: ("alien", 1)}
+ITEM_BITS = 3
+
+def encode_road(road):
+    """Packs a list of (item, direction) into a road key."""
+    key, shift = 0, 0
+    for item, direction in road:
+        if item in ITEM_BASE_CODES:
+            key |= (ITEM_BASE_CODES[item] + (1 if direction == 1 else 0)) << shift
+            shift += ITEM_BITS
+    return key
+
+def decode_road_key(key):
+    """Turns a road key back into the list of (item, direction) it was built from."""
+    road = []
+    while key:
+        road.append(ITEM_BY_CODE[key & 7])
+        key >>= ITEM_BITS
+    return road
+
+# Bounded, so a worker's memory stays flat however many distinct sequences it meets
+ROAD_STATS_CACHE_SIZE = 1 << 16
+
+# Roads scored through the cache, for the hit rate reported by road_stats_cache_info
+_road_stats_counters = {'roads': 0}
+
+@lru_cache(maxsize=ROAD_STATS_CACHE_SIZE)
+def _road_stats_for_key(key):
+    return _evaluate_road_stats(decode_road_key(key))
+
+def road_stats_for_key(key, roads=1):
+    """
+    Cached per-road stats of a road key (see encode_road), counted as 'roads'
+    roads sharing that sequence. The returned dict is shared: don't modify it.
+    """
+    _road_stats_counters['roads'] += roads
+    return _road_stats_for_key(key)
+
+def road_stats_cache_info():
+    """
+    Returns how well the road stats cache is doing in this process: roads
+    scored, distinct sequences actually evaluated, entries held and hit rate.
+    """
+    info = _road_stats_for_key.cache_info()
+    roads = _road_stats_counters['roads']
+    return {
+        'roads': roads,
+        'evaluated': info.misses,
+        'cached': info.currsize,
+        'hit_rate': 1 - info.misses / roads if roads else 0.0,
+    }
+
+def build_road_fragments(game_tiles):
+    """
+    Compiles every placement into its road fragments.
+
+    Returns fragments[position][placement], placement being
+    piece * 8 + side * 4 + orientation, as a tuple of
+    (node1, node2, slot, code_1_to_2, code_2_to_1) records: the global nodes
+    joined by the road, its slot (position * 2 + road index, the order in
+    which _build_all_roads_from_uf meets the edges) and the item code when the
+    segment is read from node1 to node2 and the other way around.
+    """
+    fragments = []
+    for position in range(9):
+        position_fragments = []
+        for piece in range(9):
+            for side in range(2):
+                for orientation in range(4):
+                    records = []
+                    for road_index, road_info in enumerate(game_tiles[piece][side].get("roads", [])):
+                        c1, c2 = road_info['connection']
+                        g1 = TILE_NODES[position][(c1 + orientation) % 4]
+                        g2 = TILE_NODES[position][(c2 + orientation) % 4]
+                        code_forward = code_backward = ITEM_BASE_CODES.get(road_info.get('item', ''), 0)
+                        d = road_info.get('direction', -1)
+                        if code_forward and d != -1:
+                            target_node = TILE_NODES[position][(d + orientation) % 4]
+                            code_forward += 1 if target_node == g2 else 0
+                            code_backward += 1 if target_node == g1 else 0
+                        records.append((g1, g2, position * 2 + road_index, code_forward, code_backward))
+                    position_fragments.append(tuple(records))
+        fragments.append(position_fragments)
+    return fragments
+
 def analyze_road_network(solution, game_tiles, uf_structure):
     """
     Analyzes the road network of a solution.
     
     If a pre-calculated uf_structure is provided, it uses the optimized
     road-building function. Otherwise, it falls back to the original BFS-based method.
+    A RoadAssembler from the search is used as is: its roads are already built.
     """
     # Choose the road-building function based on whether uf_structure was provided.
-    if uf_structure:
-        # Use the optimized version
-        all_roads = _build_all_roads_from_uf(solution, game_tiles, uf_structure)
+    if isinstance(uf_structure, RoadAssembler):
+        # Roads were assembled while the tiles were placed: their keys are ready
+        road_entries = uf_structure.roads()
     else:
-        # Fall back to the original, slower version
-        all_roads = _build_all_roads(solution, game_tiles)
+        if uf_structure:
+            # Use the optimized version
+            all_roads = _build_all_roads_from_uf(solution, game_tiles, uf_structure)
+        else:
+            # Fall back to the original, slower version
+            all_roads = _build_all_roads(solution, game_tiles)
+        road_entries = [(encode_road(road), len(road)) for road in all_roads]
     
     agg_stats = {
-        "total_roads": len(all_roads), "aliens_caught": 0, "max_aliens_running_towards_agent": 0,
+        "total_roads": len(road_entries), "aliens_caught": 0, "max_aliens_running_towards_agent": 0,
         "max_hamburgers_in_front_of_alien": 0, "max_agents_on_one_road": 0, "max_aliens_on_one_road": 0,
         "max_aliens_between_two_agents": 0, "total_food_chain_sets": 0
     }
     
     road_lengths = []
-    for road in all_roads:
-        road_lengths.append(len(road))
-        road_stats = _process_road_for_stats(road)
+    for key, length in road_entries:
+        road_lengths.append(length)
+        road_stats = road_stats_for_key(key)
         if not road_stats: continue
 
         agg_stats["aliens_caught"] += road_stats.get('aliens_caught', 0)
@@ -479,6 +607,153 @@ class UnionFind:
         new_uf.parent = self.parent[:]
         return new_uf
 
+class TrailUnionFind:
+    """
+    Union-Find with an undo log (trail) instead of copies. It uses union by size
+    and no path compression, so the tree depth stays logarithmic and every union
+    can be undone by popping a single entry from the trail.
+    """
+    def __init__(self, size):
+        self.parent = list(range(size))
+        self.size = [1] * size
+        self.trail = []
+
+    def find(self, i):
+        parent = self.parent
+        while parent[i] != i:
+            i = parent[i]
+        return i
+
+    def union(self, i, j):
+        root_i = self.find(i)
+        root_j = self.find(j)
+        if root_i == root_j:
+            return True
+        if self.size[root_i] > self.size[root_j]:
+            root_i, root_j = root_j, root_i
+        self.parent[root_i] = root_j
+        self.size[root_j] += self.size[root_i]
+        self.trail.append(root_i)
+        return False
+
+    def checkpoint(self):
+        """Returns a marker that rollback() can return to."""
+        return len(self.trail)
+
+    def rollback(self, checkpoint):
+        """Undoes every union made since the given checkpoint."""
+        while len(self.trail) > checkpoint:
+            root = self.trail.pop()
+            self.size[self.parent[root]] -= self.size[root]
+            self.parent[root] = root
+
+    def copy(self):
+        new_uf = TrailUnionFind(len(self.parent))
+        new_uf.parent = self.parent[:]
+        new_uf.size = self.size[:]
+        new_uf.trail = self.trail[:]
+        return new_uf
+
+class RoadAssembler:
+    """
+    Builds the roads incrementally while tiles are placed, with the same
+    checkpoint/rollback interface as TrailUnionFind.
+
+    Every road is a path, stored once per endpoint in 'ends' as
+    (node_a, slot_a, node_b, slot_b, key_a_to_b, key_b_to_a, key_bits, length),
+    where slot_* is the slot of the edge at that endpoint and the keys are the
+    packed item sequences read in each direction. Joining two roads through a
+    new fragment is a few shifts and ORs, and a fragment whose two nodes are
+    the ends of the same road closes a cycle.
+    """
+    def __init__(self, size=NUM_NODES):
+        self.ends = [None] * size
+        self.trail = []
+
+    def add_fragment(self, node1, node2, slot, code_forward, code_backward):
+        """Adds one road fragment. Returns True if it would close a cycle (nothing is changed)."""
+        return self.add_fragments(((node1, node2, slot, code_forward, code_backward),))
+
+    def add_fragments(self, fragments):
+        """
+        Adds every fragment of a tile. Returns True as soon as one closes a
+        cycle; the fragments added before it are left for rollback() to undo.
+        """
+        ends, trail = self.ends, self.trail
+        for node1, node2, slot, code_forward, code_backward in fragments:
+            left, right = ends[node1], ends[node2]
+            if left is not None and left is right:
+                return True
+
+            middle_bits = ITEM_BITS if code_forward else 0
+
+            # Part before the fragment, read towards node1
+            if left is None:
+                node_a, slot_a, forward_1, backward_1, bits_1, length_1 = node1, slot, 0, 0, 0, 0
+            elif left[2] == node1:
+                node_a, slot_a, _, _, forward_1, backward_1, bits_1, length_1 = left
+            else:
+                node_a, slot_a, forward_1, backward_1, bits_1, length_1 = left[2], left[3], left[5], left[4], left[6], left[7]
+
+            # Part after the fragment, read away from node2
+            if right is None:
+                node_b, slot_b, forward_2, backward_2, bits_2, length_2 = node2, slot, 0, 0, 0, 0
+            elif right[0] == node2:
+                _, _, node_b, slot_b, forward_2, backward_2, bits_2, length_2 = right
+            else:
+                node_b, slot_b, forward_2, backward_2, bits_2, length_2 = right[0], right[1], right[5], right[4], right[6], right[7]
+
+            road = (
+                node_a, slot_a, node_b, slot_b,
+                forward_1 | code_forward << bits_1 | forward_2 << (bits_1 + middle_bits),
+                backward_2 | code_backward << bits_2 | backward_1 << (bits_2 + middle_bits),
+                bits_1 + middle_bits + bits_2,
+                length_1 + 1 + length_2,
+            )
+
+            # The far ends held 'left' and 'right' before, so one record undoes all four writes
+            trail.append((node1, node2, node_a, node_b, left, right))
+            ends[node1] = None
+            ends[node2] = None
+            ends[node_a] = road
+            ends[node_b] = road
+        return False
+
+    def checkpoint(self):
+        """Returns a marker that rollback() can return to."""
+        return len(self.trail)
+
+    def rollback(self, checkpoint):
+        """Undoes every fragment added since the given checkpoint."""
+        trail, ends = self.trail, self.ends
+        while len(trail) > checkpoint:
+            node1, node2, node_a, node_b, left, right = trail.pop()
+            ends[node_a] = left
+            ends[node_b] = right
+            ends[node1] = left
+            ends[node2] = right
+
+    def roads(self):
+        """
+        Returns (key, length) for every road. Each road is read from the
+        endpoint _build_all_roads_from_uf starts at: the one whose edge comes
+        first, or the lower node when the road is a single edge.
+        """
+        roads = []
+        for node, road in enumerate(self.ends):
+            if road is not None and road[0] == node:
+                if (road[1], road[0]) < (road[3], road[2]):
+                    roads.append((road[4], road[7]))
+                else:
+                    roads.append((road[5], road[7]))
+        return roads
+
+    def copy(self):
+        new_assembler = RoadAssembler(len(self.ends))
+        new_assembler.ends = self.ends[:]
+        new_assembler.trail = self.trail[:]
+        return new_assembler
+
 def _get_tile_connections(tile_data, orientation):
     connections = [0, 0, 0, 0]  # [Norte, Leste, Sul, Oeste]
     if tile_data and tile_data.get("roads"):
@@ -0,0 +1,260 @@
+# batch_analysis.py
+"""
+Vectorized version of analysis.calculate_solution_stats.
+
+calculate_solution_stats_batch scores a whole block of layouts at once: an
+(N, 9, 3) uint8 array of (piece, side, orientation) per position goes in and an
+(N, 27) uint8 matrix with the SOLUTION_STAT_COLUMNS comes out. Everything that
+depends on a tile is read from tables precomputed per (piece, side, orientation)
+by build_batch_tables, so the only per-solution work is NumPy indexing.
+"""
+import numpy as np
+
+from analysis import (
+    STAT_KEYS, SOLUTION_STAT_COLUMNS, ITEM_BASE_CODES, ITEM_BITS,
+    find_largest_component_size, road_stats_for_key,
+)
+from constants import TILE_NODES, NUM_NODES
+
+# Placement index used by every table: same bit layout as the solver's bitboards
+NUM_PLACEMENTS = 9 * 2 * 4
+
+# Per-road stats, in the column order of the road stats table
+ROAD_STAT_KEYS = [
+    "num_agents", "num_aliens", "aliens_caught", "max_aliens_running_towards_agent",
+    "max_hamburgers_in_front_of_alien", "max_aliens_between_two_agents", "food_chain_sets",
+]
+
+# Tile properties used by the adjacency stats, in the order of ADJACENCY columns
+ADJACENCY_STATS = [
+    ("largest_dog_group", "dogs"),
+    ("largest_house_group", "houses"),
+    ("largest_citizen_group", "citizens"),
+    ("largest_safe_zone_size", "is_safe"),
+]
+
+_COLUMN = {key: i for i, key in enumerate(SOLUTION_STAT_COLUMNS)}
+
+
+def _largest_group_table():
+    """Largest orthogonally connected group for each of the 512 masks of the 3x3 grid."""
+    table = np.zeros(512, dtype=np.uint8)
+    for mask in range(512):
+        grid = [[{'flag': (mask >> (r * 3 + c)) & 1} for c in range(3)] for r in range(3)]
+        table[mask] = find_largest_component_size(grid, 'flag')
+    return table
+
+
+def build_batch_tables(game_tiles):
+    """
+    Precomputes every lookup table used by calculate_solution_stats_batch.
+
+    Placements are indexed as piece * 8 + side * 4 + orientation. Each tile
+    has at most two roads and each of its connection points belongs to at
+    most one of them, so a road is addressed by the edge slot position * 2 + r.
+    """
+    tile_stats = np.zeros((9, 2, len(STAT_KEYS)), dtype=np.int16)
+    no_roads = np.zeros((9, 2), dtype=np.int16)
+    adjacency_flags = np.zeros((9, 2, len(ADJACENCY_STATS)), dtype=np.int16)
+    for piece in range(9):
+        for side in range(2):
+            tile_data = game_tiles[piece][side]
+            for k, key in enumerate(STAT_KEYS):
+                tile_stats[piece, side, k] = tile_data.get(key, 0)
+            no_roads[piece, side] = 0 if tile_data.get("roads") else 1
+            properties = {
+                'dogs': tile_data.get('dogs', 0),
+                'houses': tile_data.get('houses', 0),
+                'citizens': tile_data.get('boys', 0) + tile_data.get('girls', 0),
+                'is_safe': 1 if tile_data.get('aliens', 0) == 0 else 0,
+            }
+            for k, (_, property_key) in enumerate(ADJACENCY_STATS):
+                adjacency_flags[piece, side, k] = 1 if properties[property_key] > 0 else 0
+
+    # [position, placement, road]: global end nodes, item code and the node the item faces
+    edge_a = np.full((9, NUM_PLACEMENTS, 2), -1, dtype=np.int8)
+    edge_b = np.full((9, NUM_PLACEMENTS, 2), -1, dtype=np.int8)
+    edge_item = np.zeros((9, NUM_PLACEMENTS, 2), dtype=np.int64)
+    edge_target = np.full((9, NUM_PLACEMENTS, 2), -1, dtype=np.int8)
+    # [position, placement, local side]: road using that connection point, or -1
+    road_at_side = np.full((9, NUM_PLACEMENTS, 4), -1, dtype=np.int8)
+
+    for position in range(9):
+        for piece in range(9):
+            for side in range(2):
+                for orientation in range(4):
+                    placement = piece * 8 + side * 4 + orientation
+                    for r, road in enumerate(game_tiles[piece][side].get("roads", [])):
+                        c1, c2 = road['connection']
+                        edge_a[position, placement, r] = TILE_NODES[position][(c1 + orientation) % 4]
+                        edge_b[position, placement, r] = TILE_NODES[position][(c2 + orientation) % 4]
+                        edge_item[position, placement, r] = ITEM_BASE_CODES.get(road.get('item', ''), 0)
+                        d = road.get('direction', -1)
+                        if d != -1:
+                            edge_target[position, placement, r] = TILE_NODES[position][(d + orientation) % 4]
+                        road_at_side[position, placement, (c1 + orientation) % 4] = r
+                        road_at_side[position, placement, (c2 + orientation) % 4] = r
+
+    # The (position, local side) pairs that touch each global node: one on the border, two inside
+    node_sides = [[] for _ in range(NUM_NODES)]
+    for position in range(9):
+        for local_side in range(4):
+            node_sides[TILE_NODES[position][local_side]].append((position, local_side))
+
+    return {
+        'tile_stats': tile_stats,
+        'no_roads': no_roads,
+        'adjacency_flags': adjacency_flags,
+        'largest_group': _largest_group_table(),
+        'edge_a': edge_a,
+        'edge_b': edge_b,
+        'edge_item': edge_item,
+        'edge_target': edge_target,
+        'road_at_side': road_at_side,
+        'node_sides': node_sides,
+    }
+
+
+def _road_stats_table(keys):
+    """Per-road stats for each road key, looked up once per distinct sequence."""
+    unique_keys, inverse, counts = np.unique(keys, return_inverse=True, return_counts=True)
+    rows = np.zeros((len(unique_keys), len(ROAD_STAT_KEYS)), dtype=np.int16)
+    for i, (key, count) in enumerate(zip(unique_keys.tolist(), counts.tolist())):
+        road_stats = road_stats_for_key(key, count)
+        rows[i] = [road_stats.get(stat, 0) for stat in ROAD_STAT_KEYS]
+    return rows[inverse]
+
+
+def _trace_roads(placements, tables):
+    """
+    Walks every road of every solution at once.
+
+    Roads are simple paths, so each one is walked from both of its endpoints and
+    only the walk that starts where analysis._build_all_roads_from_uf starts is
+    kept: at the endpoint whose edge comes first in (position, road) order, or
+    at the lower node when the road is a single edge. Direction-sensitive stats
+    depend on that choice.
+
+    Returns, per road: solution index, length in edges and packed item key.
+    """
+    n = placements.shape[0]
+
+    # Edge slots (position * 2 + road) of every solution
+    positions = np.repeat(np.arange(9), 2)
+    roads = np.tile(np.arange(2), 9)
+    slot_placements = placements[:, positions]
+    edge_a = tables['edge_a'][positions, slot_placements, roads].astype(np.int64)
+    edge_b = tables['edge_b'][positions, slot_placements, roads].astype(np.int64)
+    edge_item = tables['edge_item'][positions, slot_placements, roads]
+    edge_target = tables['edge_target'][positions, slot_placements, roads].astype(np.int64)
+
+    # Edge slots incident to each node (-1 when absent)
+    incident = np.full((n, NUM_NODES, 2), -1, dtype=np.int64)
+    for node, sides in enumerate(tables['node_sides']):
+        for k, (position, local_side) in enumerate(sides):
+            road = tables['road_at_side'][position, placements[:, position], local_side].astype(np.int64)
+            incident[:, node, k] = np.where(road >= 0, position * 2 + road, -1)
+
+    degree = (incident >= 0).sum(axis=2)
+    walker_solution, walker_node = np.nonzero(degree == 1)
+    walker_edge = incident[walker_solution, walker_node].max(axis=1)
+    start_node, start_edge = walker_node.copy(), walker_edge.copy()
+
+    count = len(walker_solution)
+    length = np.zeros(count, dtype=np.int64)
+    key = np.zeros(count, dtype=np.int64)
+    shift = np.zeros(count, dtype=np.int64)
+    end_node = np.zeros(count, dtype=np.int64)
+    end_edge = np.zeros(count, dtype=np.int64)
+
+    active = np.arange(count)
+    current_node, current_edge = walker_node, walker_edge
+    while len(active):
+        sol = walker_solution[active]
+        a = edge_a[sol, current_edge]
+        b = edge_b[sol, current_edge]
+        next_node = np.where(a == current_node, b, a)
+
+        item = edge_item[sol, current_edge]
+        target = edge_target[sol, current_edge]
+        # Agents and aliens face forward along the walk when they look at the next node
+        item = np.where(item >= 2, item + (target == next_node), item)
+        key[active] |= item << shift[active]
+        shift[active] += np.where(item > 0, ITEM_BITS, 0)
+        length[active] += 1
+
+        first, second = incident[sol, next_node, 0], incident[sol, next_node, 1]
+        following = np.where(first == current_edge, second, first)
+        finished = following < 0
+        end_node[active[finished]] = next_node[finished]
+        end_edge[active[finished]] = current_edge[finished]
+
+        keep = ~finished
+        active, current_node, current_edge = active[keep], next_node[keep], following[keep]
+
+    chosen = (start_edge < end_edge) | ((start_edge == end_edge) & (start_node < end_node))
+    return walker_solution[chosen], length[chosen], key[chosen]
+
+
+def calculate_solution_stats_batch(layouts, tables, roads=None):
+    """
+    Batch counterpart of analysis.calculate_solution_stats.
+
+    layouts: (N, 9, 3) array with (piece, side, orientation) for each position.
+    roads: optional (solution index, length, key) arrays with every road, as
+    collected from the search's RoadAssembler; traced from the layouts if omitted.
+    Returns an (N, 27) uint8 matrix whose columns follow SOLUTION_STAT_COLUMNS.
+    """
+    layouts = np.asarray(layouts, dtype=np.int64)
+    n = layouts.shape[0]
+    pieces, sides, orientations = layouts[:, :, 0], layouts[:, :, 1], layouts[:, :, 2]
+    placements = pieces * 8 + sides * 4 + orientations
+    stats = np.zeros((n, len(SOLUTION_STAT_COLUMNS)), dtype=np.int64)
+
+    # --- Tile sums ---
+    tile_totals = tables['tile_stats'][pieces, sides].sum(axis=1)
+    for k, key in enumerate(STAT_KEYS):
+        stats[:, _COLUMN[f"total_{key}"]] = tile_totals[:, k]
+    stats[:, _COLUMN["total_tiles_without_roads"]] = tables['no_roads'][pieces, sides].sum(axis=1)
+
+    # --- Road network ---
+    if roads is None:
+        solution, length, key = _trace_roads(placements, tables)
+    else:
+        solution, length, key = (np.asarray(values, dtype=np.int64) for values in roads)
+    road_stats = _road_stats_table(key)
+    road_column = {stat: i for i, stat in enumerate(ROAD_STAT_KEYS)}
+
+    stats[:, _COLUMN["total_roads"]] = np.bincount(solution, minlength=n)
+    stats[:, _COLUMN["total_captured_aliens"]] += np.bincount(solution, weights=road_stats[:, road_column['aliens_caught']], minlength=n).astype(np.int64)
+    stats[:, _COLUMN["total_food_chain_sets"]] = np.bincount(solution, weights=road_stats[:, road_column['food_chain_sets']], minlength=n).astype(np.int64)
+    for column, stat in [
+        ("max_aliens_running_towards_agent", 'max_aliens_running_towards_agent'),
+        ("max_hamburgers_in_front_of_alien", 'max_hamburgers_in_front_of_alien'),
+        ("max_agents_on_one_road", 'num_agents'),
+        ("max_aliens_on_one_road", 'num_aliens'),
+        ("max_aliens_between_two_agents", 'max_aliens_between_two_agents'),
+    ]:
+        np.maximum.at(stats[:, _COLUMN[column]], solution, road_stats[:, road_column[stat]])
+
+    np.maximum.at(stats[:, _COLUMN["longest_road_size"]], solution, length)
+    length_counts = np.zeros((n, 2 * 9 + 1), dtype=np.int64)
+    np.add.at(length_counts, (solution, length), 1)
+    stats[:, _COLUMN["max_roads_of_same_length"]] = length_counts.max(axis=1)
+
+    # --- Derived stats ---
+    free_aliens = stats[:, _COLUMN["total_aliens"]] - stats[:, _COLUMN["total_captured_aliens"]]
+    stats[:, _COLUMN["aliens_times_ufos"]] = free_aliens * stats[:, _COLUMN["total_ufos"]]
+    stats[:, _COLUMN["aliens_times_hamburgers"]] = free_aliens * stats[:, _COLUMN["total_hamburgers"]]
+    stats[:, _COLUMN["citizen_dog_pairs"]] = np.minimum(
+        stats[:, _COLUMN["total_boys"]] + stats[:, _COLUMN["total_girls"]], stats[:, _COLUMN["total_dogs"]]
+    )
+
+    # --- Adjacency groups: 9-bit mask of the tiles with the property -> largest group ---
+    position_bits = 1 << np.arange(9)
+    flags = tables['adjacency_flags'][pieces, sides]
+    for k, (column, _) in enumerate(ADJACENCY_STATS):
+        masks = (flags[:, :, k] * position_bits).sum(axis=1)
+        stats[:, _COLUMN[column]] = tables['largest_group'][masks]
+
+    return stats.astype(np.uint8)
@@ -0,0 +1,113 @@
+import duckdb
+import os
+import re
+import time
+
+from analysis import CARD_STAT_COLUMNS
+from layout_codec import LAYOUT_CODE_COLUMN
+from utils import LAYOUT_COLUMNS, MULTIPLICITY_COLUMN, get_next_filename
+
+# =============================================================================
+# CONFIGURAÇÃO
+# =============================================================================
+SOURCE_SOLUTIONS_DIR = 'generated_solutions'
+TEMP_DIR = 'temp_duckdb'
+
+# =============================================================================
+# FUNÇÕES AUXILIARES
+# =============================================================================
+
+def find_latest_solution_file(directory, base_name="tiling_solutions", extension="parquet"):
+    if not os.path.isdir(directory):
+        return None, f"Diretório '{directory}' não encontrado."
+    pattern = re.compile(rf"{base_name}_(\d+)\.{extension}")
+    highest_index = -1
+    latest_file_path = None
+    for filename in os.listdir(directory):
+        match = pattern.match(filename)
+        if match:
+            index = int(match.group(1))
+            if index > highest_index:
+                highest_index = index
+                latest_file_path = os.path.join(directory, filename)
+    if latest_file_path:
+        return latest_file_path, None
+    else:
+        return None, f"Nenhum arquivo encontrado em '{directory}'."
+
+# =============================================================================
+# AGREGAÇÃO
+# =============================================================================
+
+def build_stat_tuples(parquet_file_path, output_path):
+    """
+    Agrupa as soluções pelo vetor das 24 estatísticas das cartas, numa única
+    passada sobre o Parquet. Cada linha de saída traz o vetor, quantos
+    tabuleiros o têm ('multiplicity') e o menor desses tabuleiros (na ordem das
+    colunas de layout) como representante. Mesmo formato que
+    'main.py --stats-only --joint-counts' grava. Arquivos compactados
+    (main.py --packed) mantêm o representante como 'layout_code', o menor
+    código do grupo.
+    """
+    os.makedirs(TEMP_DIR, exist_ok=True)
+    con = duckdb.connect()
+    con.execute("PRAGMA memory_limit='20GB';")
+    con.execute(f"PRAGMA threads={os.cpu_count()};")
+    con.execute(f"PRAGMA temp_directory='{TEMP_DIR}';")
+    con.execute("PRAGMA enable_progress_bar=true;")
+
+    # Execuções reduzidas (main.py --reduced) já trazem quantos tabuleiros cada linha representa
+    parquet_columns = [row[0] for row in con.execute(f"DESCRIBE SELECT * FROM read_parquet('{parquet_file_path}')").fetchall()]
+    if MULTIPLICITY_COLUMN in parquet_columns:
+        multiplicity_sql = f'SUM("{MULTIPLICITY_COLUMN}")'
+    else:
+        multiplicity_sql = "COUNT(*)"
+
+    stats_sql = ", ".join(f'"{col}"' for col in CARD_STAT_COLUMNS)
+    if LAYOUT_CODE_COLUMN in parquet_columns:
+        layout_struct_sql = f'"{LAYOUT_CODE_COLUMN}"'
+        layout_select_sql = f'CAST(representative AS UBIGINT) AS "{LAYOUT_CODE_COLUMN}"'
+    else:
+        layout_struct_sql = "{" + ", ".join(f"'{col}': \"{col}\"" for col in LAYOUT_COLUMNS) + "}"
+        layout_select_sql = ", ".join(f'CAST(representative."{col}" AS UTINYINT) AS "{col}"' for col in LAYOUT_COLUMNS)
+    stat_select_sql = ", ".join(f'CAST("{col}" AS UTINYINT) AS "{col}"' for col in CARD_STAT_COLUMNS)
+
+    print(f"🚀 Agrupando '{parquet_file_path}' por vetor de estatísticas...")
+    con.execute(f"""
+        COPY (
+            SELECT {stat_select_sql}, CAST(multiplicity AS UBIGINT) AS "{MULTIPLICITY_COLUMN}", {layout_select_sql}
+            FROM (
+                SELECT {stats_sql}, {multiplicity_sql} AS multiplicity, MIN({layout_struct_sql}) AS representative
+                FROM read_parquet('{parquet_file_path}')
+                GROUP BY {stats_sql}
+            )
+            ORDER BY {stats_sql}
+        ) TO '{output_path}' WITH (FORMAT PARQUET);
+    """)
+
+    tuple_count, layout_count = con.execute(
+        f"SELECT COUNT(*), SUM(\"{MULTIPLICITY_COLUMN}\") FROM read_parquet('{output_path}')"
+    ).fetchone()
+    con.close()
+    try:
+        os.rmdir(TEMP_DIR)
+    except OSError:
+        pass
+    print(f"✅ {tuple_count:,} vetores distintos (de {layout_count:,} tabuleiros) salvos em '{output_path}'.")
+
+# =============================================================================
+# EXECUTOR PRINCIPAL
+# =============================================================================
+def main():
+    start_time = time.time()
+    parquet_file, error = find_latest_solution_file(SOURCE_SOLUTIONS_DIR)
+    if error:
+        print(f"❌ ERRO: {error}")
+        return
+
+    output_path = get_next_filename(SOURCE_SOLUTIONS_DIR, "stat_tuples")
+    build_stat_tuples(parquet_file, output_path)
+    print(f"✅ Processo concluído em {(time.time() - start_time) / 60:.2f} minutos.")
+
+if __name__ == "__main__":
+    main()
@@ -32,6 +32,9 @@ NEIGHBOURS = (
     (5, 7)        # 8
 )
 
+# Position of the first tile placed, always with orientation 0 (main.py)
+CENTER_POSITION = 4
+
 # Direction constants
 NORTH, EAST, SOUTH, WEST = 0, 1, 2, 3
 
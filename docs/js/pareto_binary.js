@@ -0,0 +1,84 @@
+// docs/js/pareto_binary.js
+//
+// Leitor do pareto_front.bin gravado por generate_pareto.py --binary
+// (formato descrito em pareto_binary.py). Devolve o mesmo objeto de
+// pareto_front.json: {"3_7": [{scores: [...], board: [[peça, lado, orientação] x 9]}, ...]}.
+
+const PARETO_MAGIC = 'NTPF';
+const PARETO_VERSION = 1;
+const PARETO_MAX_CARDS = 3;
+
+// (8 - 1 - i)! para cada posição do código de Lehmer
+const LEHMER_FACTORIALS = [40320, 5040, 720, 120, 24, 6, 2, 1, 1];
+
+// Decodifica um layout_code (layout_codec.py) dado pelas suas metades de 32 bits
+function decodeLayoutCode(lo, hi) {
+    // Bits 27-45: posto da permutação das peças (cabe com folga num Number)
+    let rank = hi * 32 + (lo >>> 27);
+    const remaining = [0, 1, 2, 3, 4, 5, 6, 7, 8];
+    const board = [];
+    for (let position = 0; position < 9; position++) {
+        const digit = Math.floor(rank / LEHMER_FACTORIALS[position]);
+        rank -= digit * LEHMER_FACTORIALS[position];
+        const piece = remaining.splice(digit, 1)[0];
+        const side = (lo >>> (18 + position)) & 1;
+        const orient = (lo >>> (2 * position)) & 3;
+        board.push([piece, side, orient]);
+    }
+    return board;
+}
+
+function decodeParetoBinary(buffer) {
+    const view = new DataView(buffer);
+    const bytes = new Uint8Array(buffer);
+    const magic = String.fromCharCode(...bytes.subarray(0, 4));
+    if (magic !== PARETO_MAGIC || view.getUint32(4, true) !== PARETO_VERSION) {
+        throw new Error(`Not a version ${PARETO_VERSION} Pareto binary file.`);
+    }
+    const numCombos = view.getUint32(8, true);
+    const numBoards = view.getUint32(12, true);
+
+    const combosStart = 16;
+    const offsetsStart = combosStart + numCombos * (PARETO_MAX_CARDS + 1);
+    let codesStart = offsetsStart + (numCombos + 1) * 4;
+    codesStart += (8 - codesStart % 8) % 8;
+    let scorePosition = codesStart + numBoards * 8;
+
+    const paretoLibrary = {};
+    for (let i = 0; i < numCombos; i++) {
+        const comboStart = combosStart + i * (PARETO_MAX_CARDS + 1);
+        const numCards = bytes[comboStart];
+        const comboKey = Array.from(bytes.subarray(comboStart + 1, comboStart + 1 + numCards)).join('_');
+        const start = view.getUint32(offsetsStart + i * 4, true);
+        const stop = view.getUint32(offsetsStart + (i + 1) * 4, true);
+
+        const solutions = [];
+        for (let board = start; board < stop; board++) {
+            const codeStart = codesStart + board * 8;
+            solutions.push({
+                scores: Array.from(bytes.subarray(scorePosition, scorePosition + numCards)),
+                board: decodeLayoutCode(view.getUint32(codeStart, true), view.getUint32(codeStart + 4, true)),
+            });
+            scorePosition += numCards;
+        }
+        paretoLibrary[comboKey] = solutions;
+    }
+    return paretoLibrary;
+}
+
+async function loadParetoBinary(path) {
+    const response = await fetch(path);
+    if (!response.ok) {
+        throw new Error(`HTTP error! status: ${response.status} for file ${path}`);
+    }
+    return decodeParetoBinary(await response.arrayBuffer());
+}
+
+// Expondo para o script principal (e para o Node, em testes)
+if (typeof window !== 'undefined') {
+    window.decodeParetoBinary = decodeParetoBinary;
+    window.loadParetoBinary = loadParetoBinary;
+}
+if (typeof module !== 'undefined') {
+    module.exports = { decodeLayoutCode, decodeParetoBinary, loadParetoBinary };
+}
@@ -9,6 +9,9 @@ let gameData = {
     tiles: [],
     cards: [],
     solutions: {},
+    // Com best_solutions fragmentado (post_process.py --sharded): índice e fragmentos já pedidos
+    solutionShards: null,
+    solutionShardRequests: new Map(),
     percentiles: {},
     cardMap: new Map(),
 };
@@ -45,12 +48,53 @@ async function loadFile(path, description) {
     }
 }
 
+// Índice dos fragmentos de best_solutions, ou null se o site só tem o arquivo inteiro
+async function loadSolutionShardIndex() {
+    try {
+        const response = await fetch('data/best_solutions/index.json');
+        if (response.ok) {
+            return (await response.json()).shards;
+        }
+    } catch (error) {
+        console.warn("No best_solutions shard index, loading the whole file.", error);
+    }
+    return null;
+}
+
+// Garante em gameData.solutions as soluções das combinações que começam pela menor carta escolhida
+function loadSolutionShard(firstCardId) {
+    if (!gameData.solutionShards) return Promise.resolve();
+    const shard = gameData.solutionShards[String(firstCardId)];
+    if (!shard) return Promise.resolve();
+    if (!gameData.solutionShardRequests.has(shard.file)) {
+        const request = fetch(`data/best_solutions/${shard.file}`)
+            .then(response => {
+                if (!response.ok) {
+                    throw new Error(`HTTP error! status: ${response.status} for file ${shard.file}`);
+                }
+                return response.json();
+            })
+            .then(solutions => Object.assign(gameData.solutions, solutions))
+            .catch(error => {
+                // Permite tentar de novo no próximo clique
+                gameData.solutionShardRequests.delete(shard.file);
+                throw error;
+            });
+        gameData.solutionShardRequests.set(shard.file, request);
+    }
+    return gameData.solutionShardRequests.get(shard.file);
+}
+
 async function loadData() {
     try {
         gameData.tiles = await loadFile('data/tiles.json', 'tile definitions');
         gameData.cards = await loadFile('data/cards.json', 'card definitions');
         gameData.cardMap = new Map(gameData.cards.map(card => [card.number, card]));
-        gameData.solutions = await loadFile('data/best_solutions.json', 'optimal solutions');
+        // Com fragmentos, as soluções só são baixadas quando as cartas são escolhidas
+        gameData.solutionShards = await loadSolutionShardIndex();
+        if (!gameData.solutionShards) {
+            gameData.solutions = await loadFile('data/best_solutions.json', 'optimal solutions');
+        }
         gameData.percentiles = await loadFile('data/percentiles.json', 'percentile data');
         document.getElementById('loading-text').textContent = "Data loaded successfully!";
         return true;
@@ -375,13 +419,25 @@ function handleCardClick(e) {
     document.getElementById('optimal-solution-btn').disabled = appState.selectedCards.size === 0;
     renderCardSelection();
     updateStats();
+
+    // Adianta o download do fragmento que o botão de solução ótima vai precisar
+    if (appState.selectedCards.size > 0) {
+        loadSolutionShard(Math.min(...appState.selectedCards)).catch(error => console.error(error));
+    }
 }
 
-function showOptimalSolution() {
+async function showOptimalSolution() {
     if (appState.selectedCards.size === 0) return;
     
     const sortedCardIds = Array.from(appState.selectedCards).sort((a,b)=>a-b);
     const solutionKey = sortedCardIds.join('_');
+    try {
+        await loadSolutionShard(sortedCardIds[0]);
+    } catch (error) {
+        console.error("Error loading optimal solutions:", error);
+        alert("Could not load the optimal solutions. Please try again.");
+        return;
+    }
     const optimalSolution = gameData.solutions[solutionKey];
     
     if (optimalSolution) {
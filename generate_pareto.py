@@ -4,6 +4,15 @@ import json
 import itertools
 import os
 import time
+import argparse
+import multiprocessing
+import shutil
+
+from json_shards import write_json_shards
+from layout_codec import LAYOUT_CODE_COLUMN, encode_layouts, decode_layouts
+from pareto_binary import write_pareto_binary
+from skyline import skyline
+from utils import LAYOUT_COLUMNS
 
 # =============================================================================
 # CONFIGURAÇÕES
@@ -11,43 +20,83 @@ import time
 SOURCE_SOLUTIONS_DIR = 'generated_solutions'
 CARDS_JSON_PATH = 'game/cards/cards.json'
 OUTPUT_PARETO_FILE = 'docs/data/pareto_front.json'
+# Com --sharded, a biblioteca também sai dividida pela primeira carta (json_shards)
+OUTPUT_PARETO_SHARDS_DIR = 'docs/data/pareto_front'
+# Com --binary, também em formato binário (pareto_binary; lido por docs/js/pareto_binary.js)
+OUTPUT_PARETO_BINARY_FILE = 'docs/data/pareto_front.bin'
 
 # =============================================================================
-# FUNÇÕES DE APOIO MATEMÁTICO
+# FUNÇÕES DE APOIO
 # =============================================================================
-def get_pareto_indices(scores_matrix, is_max_array):
-    pts = scores_matrix.copy()
-    for col_idx, is_max in enumerate(is_max_array):
-        if not is_max:
-            pts[:, col_idx] = -pts[:, col_idx]
-
-    is_efficient = np.ones(pts.shape[0], dtype=bool)
-    for i in range(pts.shape[0]):
-        if is_efficient[i]:
-            dominated = np.all(pts <= pts[i], axis=1) & np.any(pts < pts[i], axis=1)
-            is_efficient[dominated] = False
-            
-    return np.where(is_efficient)[0]
-
 def find_latest_solution_file(directory, base_name="tiling_solutions", extension="parquet"):
     import re
     if not os.path.isdir(directory): return None
-    files = [f for f in os.listdir(directory) if f.endswith(f'.{extension}')]
-    # Filtra para ter certeza de pegar o arquivo original, sem ID
-    files = [f for f in files if 'with_id' not in f]
+    # Só arquivos do tipo pedido (ex: tiling_solutions_3.parquet), pegando o de maior índice
+    pattern = re.compile(rf"{base_name}_(\d+)\.{extension}$")
+    files = [(int(m.group(1)), f) for f in os.listdir(directory) if (m := pattern.match(f))]
     
     if files:
-        return os.path.join(directory, sorted(files)[-1])
+        return os.path.join(directory, max(files)[1])
     return None
 
+# =============================================================================
+# PROCESSOS DE TRABALHO
+# =============================================================================
+_worker = {}
+
+def _init_worker(stats, layout_codes, stat_keys):
+    """Guarda em cada processo os estados únicos carregados uma única vez pelo principal."""
+    _worker.update(stats=stats, layout_codes=layout_codes,
+                   key_index={key: i for i, key in enumerate(stat_keys)})
+
+def build_pareto_frontier(combo):
+    """Fronteira de Pareto de uma combinação de cartas: (chave da combinação, soluções ou None)."""
+    combo_key = "_".join(str(c['number']) for c in combo)
+    keys_to_select = [c['key'] for c in combo]
+    is_max_array = [True if c['type'] == 'max' else False for c in combo]
+    
+    stats = _worker['stats']
+    if not len(stats):
+        return combo_key, None
+
+    # Projeção nas cartas da combinação: os (até 3) bytes viram um único inteiro,
+    # e np.unique faz o papel do GROUP BY, guardando um tabuleiro (índice) por grupo
+    values = stats[:, [_worker['key_index'][k] for k in keys_to_select]]
+    projection_keys = np.zeros(len(values), dtype=np.int64)
+    for i in range(values.shape[1]):
+        projection_keys |= values[:, i].astype(np.int64) << (8 * i)
+    _, first = np.unique(projection_keys, return_index=True)
+
+    scores_matrix = values[first]
+    pareto_mask = skyline(scores_matrix, is_max_array)
+    
+    # Mantém a matriz como uma lista plana de 9 itens lógicos
+    boards = decode_layouts(_worker['layout_codes'][first[pareto_mask]]).reshape(-1, 9, 3).tolist()
+    pareto_solutions = [
+        {"scores": scores, "board": board}
+        for scores, board in zip(scores_matrix[pareto_mask].tolist(), boards)
+    ]
+        
+    return combo_key, pareto_solutions
+
 # =============================================================================
 # MOTOR PRINCIPAL (CORRIGIDO CONTRA OOM)
 # =============================================================================
 def main():
+    parser = argparse.ArgumentParser(description="Gera as fronteiras de Pareto de todas as combinações de cartas.")
+    parser.add_argument("--stat-tuples", action="store_true",
+                        help="usa a tabela agregada mais recente (stat_tuples_N.parquet, de build_stat_tuples.py) "
+                             "em vez de todas as soluções")
+    parser.add_argument("--sharded", action="store_true",
+                        help=f"também divide a biblioteca em um arquivo por primeira carta, com um índice, em '{OUTPUT_PARETO_SHARDS_DIR}'")
+    parser.add_argument("--binary", action="store_true",
+                        help=f"também salva a biblioteca no formato binário compacto em '{OUTPUT_PARETO_BINARY_FILE}'")
+    args = parser.parse_args()
+
     print("🚀 Iniciando Motor de Fronteira de Pareto...")
     start_time = time.time()
     
-    parquet_file = find_latest_solution_file(SOURCE_SOLUTIONS_DIR)
+    parquet_file = find_latest_solution_file(SOURCE_SOLUTIONS_DIR, "stat_tuples" if args.stat_tuples else "tiling_solutions")
     if not parquet_file:
         print(f"❌ ERRO: Arquivo parquet válido não encontrado em {SOURCE_SOLUTIONS_DIR}.")
         return
@@ -58,7 +107,8 @@ def main():
         cards_data = json.load(f)
         
     valid_cards = [c for c in cards_data if c.get('key') and c.get('type')]
-    all_keys = [c['key'] for c in valid_cards]
+    # Cartas diferentes podem pontuar a mesma estatística: cada coluna entra uma vez
+    all_keys = list(dict.fromkeys(c['key'] for c in valid_cards))
     
     # Prepara uma pasta temporária para o DuckDB usar como "RAM Extra" (Spilling)
     os.makedirs('temp_duckdb', exist_ok=True)
@@ -77,15 +127,13 @@ def main():
     all_columns_sql = ", ".join([f'"{k}"' for k in all_keys])
     
     # Constrói o Struct do Tabuleiro
-    board_struct_parts = []
-    for r in range(3):
-        for c in range(3):
-            board_struct_parts.extend([
-                f"'p{r}{c}': piece_{r}{c}",
-                f"'s{r}{c}': side_{r}{c}",
-                f"'o{r}{c}': orient_{r}{c}"
-            ])
-    board_struct_sql = "{" + ", ".join(board_struct_parts) + "}"
+    board_struct_sql = "{" + ", ".join(f"'{column}': {column}" for column in LAYOUT_COLUMNS) + "}"
+    
+    # Arquivos compactados (main.py --packed) já guardam o tabuleiro num único uint64
+    parquet_columns = [row[0] for row in con.execute(f"DESCRIBE SELECT * FROM read_parquet('{parquet_file}')").fetchall()]
+    packed = LAYOUT_CODE_COLUMN in parquet_columns
+    if packed:
+        board_struct_sql = f'"{LAYOUT_CODE_COLUMN}"'
     
     # Usamos ANY_VALUE. É absurdamente mais leve para a RAM pois não exige ordenação.
     con.execute(f"""
@@ -100,8 +148,20 @@ def main():
     unique_count = con.execute("SELECT COUNT(*) FROM unique_states").fetchone()[0]
     print(f"📉 Compressão concluída! Extraídos {unique_count} tabuleiros únicos.\n")
 
-# =========================================================================
-    # LOOP DE PROCESSAMENTO (Rodando 100% na RAM)
+    # Os estados únicos vão uma única vez para a RAM como arrays NumPy: as
+    # estatísticas das cartas numa matriz uint8 e cada tabuleiro como layout_code
+    unique_states = con.execute(f"SELECT {all_columns_sql}, board_data FROM unique_states").to_arrow_table()
+    con.close()
+    stats = np.column_stack([unique_states.column(i).to_numpy() for i in range(len(all_keys))]).astype(np.uint8)
+    board_data = unique_states.column('board_data').combine_chunks()
+    if packed:
+        layout_codes = board_data.to_numpy().astype(np.uint64)
+    else:
+        layout_codes = encode_layouts(np.column_stack([board_data.field(column).to_numpy() for column in LAYOUT_COLUMNS]))
+    del unique_states, board_data
+
+    # =========================================================================
+    # LOOP DE PROCESSAMENTO (Em paralelo, uma combinação por tarefa)
     # =========================================================================
     pareto_library = {}
     all_combos = []
@@ -113,70 +173,39 @@ def main():
     total_combos = len(all_combos)
     print(f"⚙️ Processando {total_combos} fronteiras de Pareto...")
 
-    for idx, combo in enumerate(all_combos):
-        combo_key = "_".join(str(c['number']) for c in combo)
-        keys_to_select = [c['key'] for c in combo]
-        is_max_array = [True if c['type'] == 'max' else False for c in combo]
-        
-        columns_sql = ", ".join([f'"{k}"' for k in keys_to_select])
-        
-        query = f"""
-            SELECT ANY_VALUE(board_data) as board_struct, {columns_sql}
-            FROM unique_states
-            GROUP BY {columns_sql}
-        """
-        
-        try:
-            df_unique = con.execute(query).fetchdf()
-        except duckdb.Error as e:
-            continue
-            
-        if df_unique.empty:
-            continue
+    with multiprocessing.Pool(os.cpu_count(), initializer=_init_worker, initargs=(stats, layout_codes, all_keys)) as pool:
+        results = pool.imap(build_pareto_frontier, all_combos, chunksize=16)
+        for idx, (combo_key, pareto_solutions) in enumerate(results):
+            if pareto_solutions:
+                pareto_library[combo_key] = pareto_solutions
+                total_boards_saved += len(pareto_solutions) # <--- NOVO: Soma os tabuleiros encontrados
             
-        scores_matrix = df_unique[keys_to_select].astype(float).values
-        pareto_mask = get_pareto_indices(scores_matrix, is_max_array)
-        
-        pareto_solutions = []
-
-        # Mantém a matriz como uma lista plana de 9 itens lógicos
-        for pareto_idx in pareto_mask:
-            row = df_unique.iloc[pareto_idx]
-            
-            b_data = row['board_struct']
-            board_matrix = []
-            for r in range(3):
-                for c in range(3):
-                    board_matrix.append([
-                        b_data[f'p{r}{c}'], 
-                        b_data[f's{r}{c}'], 
-                        b_data[f'o{r}{c}']
-                    ])
-            
-            pareto_solutions.append({
-                "scores": [int(row[k]) for k in keys_to_select], # Convertendo o score pra int
-                "board": board_matrix
-            })
-            
-        pareto_library[combo_key] = pareto_solutions
-        total_boards_saved += len(pareto_solutions) # <--- NOVO: Soma os tabuleiros encontrados
-        
-        if (idx + 1) % 500 == 0 or (idx + 1) == total_combos:
-            elapsed = time.time() - start_time
-            print(f"✅ [{idx + 1}/{total_combos}] Combinações processadas... (Tempo decorrido: {elapsed/60:.2f} min)")
+            if (idx + 1) % 500 == 0 or (idx + 1) == total_combos:
+                elapsed = time.time() - start_time
+                print(f"✅ [{idx + 1}/{total_combos}] Combinações processadas... (Tempo decorrido: {elapsed/60:.2f} min)")
 
     print(f"\n💾 Formatando e salvando biblioteca de Pareto em {OUTPUT_PARETO_FILE}...")
     
     # O separators=(',', ':') arranca ABSOLUTAMENTE TODOS os espaços em branco do JSON
     with open(OUTPUT_PARETO_FILE, 'w') as f:
         json.dump(pareto_library, f, separators=(',', ':'))
+
+    if args.binary:
+        write_pareto_binary(pareto_library, OUTPUT_PARETO_BINARY_FILE)
+        print(f"💾 Versão binária salva em {OUTPUT_PARETO_BINARY_FILE} ({os.path.getsize(OUTPUT_PARETO_BINARY_FILE):,} bytes).")
+
+    if args.sharded:
+        index = write_json_shards(pareto_library, OUTPUT_PARETO_SHARDS_DIR)
+        print(f"💾 {len(index['shards'])} fragmentos salvos em {OUTPUT_PARETO_SHARDS_DIR}/")
+    elif os.path.isdir(OUTPUT_PARETO_SHARDS_DIR):
+        # Fragmentos de uma exportação anterior ficariam desatualizados
+        shutil.rmtree(OUTPUT_PARETO_SHARDS_DIR)
         
     total_time = time.time() - start_time
     print(f"🎉 Processo concluído com sucesso em {total_time/60:.2f} minutos!")
     print(f"🧩 TOTAL DE TABULEIROS ÚNICOS (Estratégias Supremas) SALVOS: {total_boards_saved:,}") # <--- NOVO: Log de fechamento
     
     # Limpeza
-    con.close()
     try:
         os.rmdir('temp_duckdb')
     except:
@@ -61,6 +61,13 @@ def create_db_from_parquet(parquet_file_path):
     print(f"🚀 Criando/Atualizando VIEW virtual para '{parquet_file_path}'...")
     
     select_clauses = [f'CAST("{col}" AS UTINYINT) AS "{col}"' for col in STAT_COLUMNS]
+
+    # Execuções reduzidas (main.py --reduced) trazem quantos tabuleiros cada linha representa
+    parquet_columns = [row[0] for row in con.execute(f"DESCRIBE SELECT * FROM read_parquet('{parquet_file_path}')").fetchall()]
+    if "multiplicity" in parquet_columns:
+        select_clauses.append('CAST("multiplicity" AS USMALLINT) AS "multiplicity"')
+    else:
+        select_clauses.append('CAST(1 AS USMALLINT) AS "multiplicity"')
     
     create_view_query = f"""
         CREATE OR REPLACE VIEW solutions AS
@@ -88,11 +95,11 @@ def calculate_percentiles():
         SELECT 
             '{stat}' AS stat_name,
             "{stat}" AS stat_value,
-            COUNT(*) AS frequency,
+            SUM(multiplicity) AS frequency,
             CAST(
-                (SUM(COUNT(*)) OVER (ORDER BY "{stat}" ASC) * 100.0) 
+                (SUM(SUM(multiplicity)) OVER (ORDER BY "{stat}" ASC) * 100.0) 
                 / 
-                SUM(COUNT(*)) OVER ()
+                SUM(SUM(multiplicity)) OVER ()
             AS DOUBLE) AS percentile
         FROM solutions
         GROUP BY "{stat}"
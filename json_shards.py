@@ -0,0 +1,52 @@
+# json_shards.py
+"""
+Sharded layout for the per-combination JSON files the site loads
+(best_solutions.json, pareto_front.json).
+
+Their keys are card combinations like "3_7_12", always in increasing order,
+so every combination a player can pick is found by its lowest card.
+write_json_shards splits {combination: value} by that card into
+output_dir/<card>.json and writes output_dir/index.json:
+
+    {"shard_by": "first_card", "shards": {"3": {"file": "3.json", "entries": 72}, ...}}
+
+The front end (docs/js/script.js) reads the index and then fetches only the
+shard of the selected cards.
+"""
+import json
+import os
+
+SHARD_INDEX_FILE = "index.json"
+
+
+def shard_key(combo_key):
+    """Lowest card of a combination key ('3_7_12' -> '3')."""
+    return combo_key.split("_", 1)[0]
+
+
+def write_json_shards(entries, output_dir):
+    """
+    Writes {combination: value} as one compact JSON file per first card plus
+    SHARD_INDEX_FILE, removing shards left over from earlier exports.
+    Returns the index.
+    """
+    shards = {}
+    for combo_key, value in entries.items():
+        shards.setdefault(shard_key(combo_key), {})[combo_key] = value
+
+    os.makedirs(output_dir, exist_ok=True)
+    index = {"shard_by": "first_card", "shards": {}}
+    for card, shard in sorted(shards.items(), key=lambda item: int(item[0])):
+        file_name = f"{card}.json"
+        with open(os.path.join(output_dir, file_name), 'w') as f:
+            json.dump(shard, f, separators=(',', ':'))
+        index["shards"][card] = {"file": file_name, "entries": len(shard)}
+
+    current_files = {shard["file"] for shard in index["shards"].values()} | {SHARD_INDEX_FILE}
+    for file_name in os.listdir(output_dir):
+        if file_name.endswith(".json") and file_name not in current_files:
+            os.remove(os.path.join(output_dir, file_name))
+
+    with open(os.path.join(output_dir, SHARD_INDEX_FILE), 'w') as f:
+        json.dump(index, f, indent=2)
+    return index
@@ -0,0 +1,86 @@
+# layout_codec.py
+"""
+Packs a board layout into a single 64-bit integer and back.
+
+A layout is 9 (piece, side, orientation) triples in board order, the same
+values as the piece_rc / side_rc / orient_rc columns. The pieces are always a
+permutation of 0-8, so they are stored as its Lehmer rank (0 to 9! - 1), and
+sides and orientations take 1 and 2 bits per position:
+
+    bits 27-45  permutation rank
+    bits 18-26  side of position p at bit 18 + p
+    bits  0-17  orientation of position p at bits 2p and 2p + 1
+
+46 bits in all, so every code fits in a uint64 (and in a signed int64).
+"""
+from math import factorial
+
+import numpy as np
+
+# Name of the uint64 column that replaces the 27 layout columns in packed files
+LAYOUT_CODE_COLUMN = "layout_code"
+
+NUM_POSITIONS = 9
+RANK_SHIFT = 27
+SIDE_SHIFT = 18
+
+_FACTORIALS = np.array([factorial(NUM_POSITIONS - 1 - i) for i in range(NUM_POSITIONS)], dtype=np.uint64)
+_SIDE_SHIFTS = (SIDE_SHIFT + np.arange(NUM_POSITIONS)).astype(np.uint64)
+_ORIENT_SHIFTS = (2 * np.arange(NUM_POSITIONS)).astype(np.uint64)
+
+
+def encode_layouts(layouts):
+    """
+    Encodes an array of layouts, shaped (N, 9, 3) or (N, 27) in LAYOUT_COLUMNS
+    order, into an (N,) uint64 array of layout codes.
+    """
+    layouts = np.asarray(layouts).reshape(-1, NUM_POSITIONS, 3)
+    pieces = layouts[:, :, 0].astype(np.int8)
+    sides = layouts[:, :, 1].astype(np.uint64)
+    orients = layouts[:, :, 2].astype(np.uint64)
+
+    # Lehmer code: how many later pieces are smaller than the one at each position
+    rank = np.zeros(len(layouts), dtype=np.uint64)
+    for i in range(NUM_POSITIONS - 1):
+        digit = (pieces[:, i + 1:] < pieces[:, i, None]).sum(axis=1, dtype=np.uint64)
+        rank += digit * _FACTORIALS[i]
+
+    codes = rank << np.uint64(RANK_SHIFT)
+    codes |= np.bitwise_or.reduce(sides << _SIDE_SHIFTS, axis=1)
+    codes |= np.bitwise_or.reduce(orients << _ORIENT_SHIFTS, axis=1)
+    return codes
+
+
+def decode_layouts(codes):
+    """
+    Decodes an array of layout codes into an (N, 27) uint8 array whose columns
+    follow LAYOUT_COLUMNS (piece, side, orient for each position).
+    """
+    codes = np.asarray(codes, dtype=np.uint64).reshape(-1)
+    layouts = np.empty((len(codes), NUM_POSITIONS, 3), dtype=np.uint8)
+
+    layouts[:, :, 1] = (codes[:, None] >> _SIDE_SHIFTS) & np.uint64(1)
+    layouts[:, :, 2] = (codes[:, None] >> _ORIENT_SHIFTS) & np.uint64(3)
+
+    # Each Lehmer digit picks the digit-th smallest piece not placed yet
+    rank = codes >> np.uint64(RANK_SHIFT)
+    remaining = np.ones((len(codes), NUM_POSITIONS), dtype=bool)
+    rows = np.arange(len(codes))
+    for i in range(NUM_POSITIONS):
+        digit, rank = np.divmod(rank, _FACTORIALS[i])
+        piece = np.argmax(np.cumsum(remaining, axis=1) > digit[:, None].astype(np.int64), axis=1)
+        layouts[:, i, 0] = piece
+        remaining[rows, piece] = False
+
+    return layouts.reshape(len(codes), NUM_POSITIONS * 3)
+
+
+def encode_layout(layout):
+    """Encodes one layout (9 (piece, side, orientation) triples) into an int."""
+    return int(encode_layouts([layout])[0])
+
+
+def decode_layout(code):
+    """Decodes one layout code into a list of 9 (piece, side, orientation) tuples."""
+    values = decode_layouts([code])[0].tolist()
+    return [tuple(values[i:i + 3]) for i in range(0, len(values), 3)]
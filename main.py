@@ -1,17 +1,38 @@
 import json
 import os
 import time
+import argparse
+import shutil
 import multiprocessing
+from collections import defaultdict
 import numpy as np
 
-from solver import find_valid_boards_generator, update_position_domain
-from analysis import UnionFind
+from solver import find_valid_boards_generator, update_position_domain, find_valid_boards_bitboard, generate_bitboard_tables, bitboard_domains, split_search_tree, candidate_bit
+from solver import tile_rotation_periods, symmetry_mask
+from analysis import TrailUnionFind, RoadAssembler, road_stats_cache_info
+from batch_analysis import build_batch_tables
 from utils import SolutionWriter, get_next_filename, merge_parquet_files
-from constants import NUM_NODES, TILE_NODES, NORTH, EAST, SOUTH, WEST
+from utils import StatsAccumulator, merge_stats_parts, histograms_to_percentiles, write_stat_tuples
+from constants import NUM_NODES, TILE_NODES, NORTH, EAST, SOUTH, WEST, CENTER_POSITION
 
 # --- Constants for the main script ---
 CHUNK_SIZE = 100_000
 TEMP_DIR = "temp_solutions"
+# One JSON line per finished subtree, so an interrupted run can be resumed
+MANIFEST_PATH = os.path.join(TEMP_DIR, "manifest.jsonl")
+# Written directly by --stats-only runs (same file post_process.py exports)
+PERCENTILES_PATH = os.path.join("docs", "data", "percentiles.json")
+# "bitboard" runs find_valid_boards_bitboard; "list" runs the original tuple/list engine
+SOLVER_ENGINE = "bitboard"
+# Tiles placed after the center one before the search is cut into independent
+# subtrees: 0 keeps the 18 center tasks, 1 gives 528 subtrees and 2 gives 12,672
+SPLIT_DEPTH = 2
+
+# Read-only data shared by every task that runs in a worker process
+_worker_context = {}
+
+def init_worker(context):
+    _worker_context.update(context)
 
 def generate_tile_connections(game_tiles):
     # Creates a 4D NumPy array with format (piece, side, orientation, connections)
@@ -69,6 +90,86 @@ def generate_required_connections_candidates(tile_connections):
 
     return connections_candidates
 
+def subtree_id(board_state):
+    """Stable name of the subtree rooted at a partial board, e.g. '0100-4610'."""
+    return "-".join(
+        f"{position}{tile[0]}{tile[1]}{tile[2]}"
+        for position, tile in enumerate(board_state) if tile is not None
+    )
+
+def build_list_engine_state(board_state, game_tiles, tile_connections, connections_candidates):
+    """Rebuilds node states, available pieces, domains and union-find of the list engine for a partial board."""
+    node_states = [-1] * 24
+    available_pieces = set(range(9))
+    uf = TrailUnionFind(NUM_NODES)
+    for position, tile in enumerate(board_state):
+        if tile is None:
+            continue
+        (piece, side, orientation) = tile
+        candidate_connections = tile_connections[piece][side][orientation]
+        node_states[TILE_NODES[position][NORTH]] = candidate_connections[NORTH]
+        node_states[TILE_NODES[position][SOUTH]] = candidate_connections[SOUTH]
+        node_states[TILE_NODES[position][EAST]] = candidate_connections[EAST]
+        node_states[TILE_NODES[position][WEST]] = candidate_connections[WEST]
+        available_pieces.remove(piece)
+        for road in game_tiles[piece][side]["roads"]:
+            local_conn1, local_conn2 = road['connection']
+            uf.union(TILE_NODES[position][(local_conn1 + orientation) % 4],
+                     TILE_NODES[position][(local_conn2 + orientation) % 4])
+
+    domains = [None] * 9
+    for position in range(9):
+        if board_state[position] is None:
+            domains[position] = update_position_domain(node_states, position, available_pieces, connections_candidates)
+    return node_states, available_pieces, domains, uf
+
+def load_manifest(split_depth, options=None):
+    """
+    Reads the manifest of a previous run and returns {subtree: entry} for every
+    subtree whose part (Parquet, or .npz in stats-only runs) was finalized.
+    Parts of subtrees that were still in flight (or finished but never
+    recorded) are deleted so they get redone. 'options' holds the on/off
+    command line switches that change what a part contains; a run can only be
+    resumed with the same ones.
+    """
+    options = options or {}
+    completed = {}
+    if os.path.exists(MANIFEST_PATH):
+        with open(MANIFEST_PATH, 'r', encoding='utf-8') as f:
+            lines = [json.loads(line) for line in f if line.strip()]
+        header = lines[0] if lines else {}
+        if header.get('split_depth') != split_depth:
+            raise SystemExit(
+                f"❌ '{TEMP_DIR}' holds a run split at depth {header.get('split_depth')}, not {split_depth}. "
+                f"Resume with --split-depth {header.get('split_depth')} or start over with --fresh."
+            )
+        for option, enabled in options.items():
+            if header.get(option, False) != enabled:
+                flag = "--" + option.replace("_", "-")
+                raise SystemExit(
+                    f"❌ '{TEMP_DIR}' holds a run {'with' if header.get(option, False) else 'without'} {flag}. "
+                    f"Resume it the same way or start over with --fresh."
+                )
+        for entry in lines[1:]:
+            if entry['part'] is None or os.path.exists(os.path.join(TEMP_DIR, entry['part'])):
+                completed[entry['subtree']] = entry
+
+    recorded_parts = {entry['part'] for entry in completed.values()}
+    for filename in os.listdir(TEMP_DIR):
+        if filename.endswith(".partial") or (filename.endswith((".parquet", ".npz")) and filename not in recorded_parts):
+            os.remove(os.path.join(TEMP_DIR, filename))
+
+    if not os.path.exists(MANIFEST_PATH):
+        append_manifest_entry({'split_depth': split_depth, **options})
+    return completed
+
+def append_manifest_entry(entry):
+    """Appends one line to the manifest and forces it to disk before moving on."""
+    with open(MANIFEST_PATH, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(entry) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
 def solve_for_task(task_config):
 
     task_start_time = time.time()
@@ -77,32 +178,87 @@ def solve_for_task(task_config):
     worker_id = task_config['id']
     board_state = task_config['board_state']
     domains = task_config['domains']
-    node_states = task_config['node_states']
-    available_pieces = task_config['available_pieces']
     uf_structure = task_config['uf_structure']
-    game_tiles = task_config['game_tiles']
-    tile_connections = task_config['tile_connections']
-    connections_candidates = task_config['connections_candidates']
+    game_tiles = _worker_context['game_tiles']
 
-    temp_file_path = os.path.join(TEMP_DIR, f"solutions_{worker_id}.parquet")
+    # The road stats cache lives for the whole worker: only this task's share is reported
+    cache_before = road_stats_cache_info()
+
+    # The part is written under a '.partial' name and only renamed once the
+    # subtree is exhausted, so a finished part is never confused with a cut one
+    stats_only = _worker_context['stats_only']
+    part_name = f"stats_{task_config['subtree']}.npz" if stats_only else f"solutions_{task_config['subtree']}.parquet"
+    temp_file_path = os.path.join(TEMP_DIR, part_name + ".partial")
     
-    with SolutionWriter(temp_file_path, CHUNK_SIZE, silent=True, worker_id=worker_id) as writer:
-        solution_generator = find_valid_boards_generator(board_state, node_states, available_pieces, game_tiles, tile_connections, connections_candidates, uf_structure, domains)
+    periods = _worker_context['symmetry_periods']
+    if stats_only:
+        writer = StatsAccumulator(CHUNK_SIZE, worker_id=worker_id, batch_tables=_worker_context['batch_tables'],
+                                  symmetry_periods=periods, joint=_worker_context['joint_counts'])
+    else:
+        writer = SolutionWriter(temp_file_path, CHUNK_SIZE, silent=True, worker_id=worker_id, batch_tables=_worker_context['batch_tables'],
+                                symmetry_periods=periods, packed=_worker_context['packed'])
+    with writer:
+        if _worker_context['engine'] == "bitboard":
+            solution_generator = find_valid_boards_bitboard(board_state, domains, uf_structure, _worker_context['bitboard_tables'])
+        else:
+            node_states = task_config['node_states']
+            available_pieces = task_config['available_pieces']
+            tile_connections = _worker_context['tile_connections']
+            connections_candidates = _worker_context['connections_candidates']
+            solution_generator = find_valid_boards_generator(board_state, node_states, available_pieces, game_tiles, tile_connections, connections_candidates, uf_structure, domains)
+
         writer.process_solutions(solution_generator, game_tiles)
+
+    if stats_only and writer.total_solutions_found:
+        writer.save(temp_file_path)
+    if os.path.exists(temp_file_path):
+        os.replace(temp_file_path, os.path.join(TEMP_DIR, part_name))
+    else:
+        part_name = None # Subtree without solutions: nothing was written
     
     task_end_time = time.time()
     task_duration = task_end_time - task_start_time
+    cache_after = road_stats_cache_info()
     
     return {
         'worker_id': worker_id,
+        'subtree': task_config['subtree'],
+        'part': part_name,
         'pid': process_id,
         'start_time': task_start_time,
         'end_time': task_end_time,
         'duration': task_duration,
-        'solutions_found': writer.total_solutions_found
+        'solutions_found': writer.total_solutions_found,
+        'layouts_represented': writer.total_multiplicity,
+        'roads_scored': cache_after['roads'] - cache_before['roads'],
+        'roads_evaluated': cache_after['evaluated'] - cache_before['evaluated'],
     }
 
 def main():
+    parser = argparse.ArgumentParser(description="Generates every valid Nine Tiles Panic board.")
+    parser.add_argument("--split-depth", type=int, default=SPLIT_DEPTH,
+                        help=f"tiles placed after the center one before splitting the search into subtrees (default: {SPLIT_DEPTH})")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(),
+                        help="number of worker processes (default: all CPU cores)")
+    parser.add_argument("--fresh", action="store_true",
+                        help=f"discard the progress recorded in '{TEMP_DIR}' instead of resuming it")
+    parser.add_argument("--stats-only", action="store_true",
+                        help=f"don't write solutions: only count how often each stat value occurs and write "
+                             f"'{PERCENTILES_PATH}' straight away")
+    parser.add_argument("--joint-counts", action="store_true",
+                        help="with --stats-only, also count every combination of card stats, keeping "
+                             "one layout of each (written to generated_solutions/stat_tuples_N.parquet)")
+    parser.add_argument("--reduced", action="store_true",
+                        help="search only the lowest of the orientations that place the same tile, with a "
+                             "'multiplicity' column holding how many layouts of the full enumeration each row stands for")
+    parser.add_argument("--packed", action="store_true",
+                        help="store each layout as a single uint64 'layout_code' column (see layout_codec.py) "
+                             "instead of 27 columns")
+    args = parser.parse_args()
+    if args.joint_counts and not args.stats_only:
+        parser.error("--joint-counts only applies to --stats-only runs")
+    if args.packed and args.stats_only:
+        parser.error("--packed only applies to runs that write solutions")
 
     global_start_time = time.time()
 
@@ -112,6 +268,17 @@ def main():
 
     tile_connections = generate_tile_connections(game_tiles)
     connections_candidates = generate_required_connections_candidates(tile_connections)
+    bitboard_tables = generate_bitboard_tables(game_tiles, tile_connections)
+    batch_tables = build_batch_tables(game_tiles)
+
+    # Reduced mode: of the orientations that place the very same tile, only the lowest one is searched
+    symmetry_periods = tile_rotation_periods(game_tiles) if args.reduced else None
+    if args.reduced:
+        canonical_candidates = symmetry_mask(bitboard_tables, symmetry_periods)
+        connections_candidates = {
+            key: [c for c in candidates if c[2] < symmetry_periods[c[0]][c[1]]]
+            for key, candidates in connections_candidates.items()
+        }
 
     # Configurations for placing the first piece
     # Mapping of the 18 specific tasks ordered from slowest to fastest based on previous runs
@@ -141,75 +308,103 @@ def main():
     search_configs = [
         {
             "name": f"Piece {piece} (Side {side}) at board center",
-            "start_pos": 4, 
+            "start_pos": CENTER_POSITION, 
             "candidates": [(piece, side, 0)] # Orientation is always 0 for the first piece
         }
         for piece, side in ordered_tasks
     ]
     # -------------------------------------------------------------------------
 
-    print("Preparing tasks (1 initial piece)...")
+    print(f"Preparing tasks (center piece + {args.split_depth} more)...")
     tasks = []
-    task_id_counter = 0
 
-    # Generate tasks with a single initial piece placed
+    # Every center configuration is expanded into the subtrees left after
+    # placing 'split_depth' more tiles. They keep the slowest-first order of
+    # ordered_tasks and are handed out one at a time to whichever worker is idle.
     for config in search_configs:
         for candidate in config['candidates']:
 
-            (piece, side, orientation) = candidate
-
             start_position = config['start_pos']
 
             board_state = [None] * 9
             board_state[start_position] = candidate
 
-            node_states = [-1] * 24
-
-            candidate_connections = tile_connections[piece][side][orientation]
-            node_states[TILE_NODES[start_position][NORTH]] = candidate_connections[NORTH]
-            node_states[TILE_NODES[start_position][SOUTH]] = candidate_connections[SOUTH]
-            node_states[TILE_NODES[start_position][EAST]] = candidate_connections[EAST]
-            node_states[TILE_NODES[start_position][WEST]] = candidate_connections[WEST]
-
-            available_pieces = set(range(9))
-            available_pieces.remove(piece)
-
-            domains = [None] * 9
-            for position in range(9):
-                if position != start_position:
-                    domains[position] = update_position_domain(node_states, position, available_pieces, connections_candidates)
-                    
-            uf = UnionFind(NUM_NODES)
-            for road in game_tiles[piece][side]["roads"]:
-                l_conn1, l_conn2 = road['connection']
-                g_id1 = TILE_NODES[start_position][(l_conn1 + orientation) % 4]
-                g_id2 = TILE_NODES[start_position][(l_conn2 + orientation) % 4]
-                uf.union(g_id1, g_id2)
-
-            tasks.append({
-                'id': task_id_counter,
-                'board_state': board_state,
-                'domains': domains,
-                'node_states': node_states,
-                'available_pieces': available_pieces,
-                'uf_structure': uf,
-                'game_tiles': game_tiles,
-                'tile_connections': tile_connections,
-                'connections_candidates': connections_candidates,
-            })
-            task_id_counter += 1
+            roads = RoadAssembler(NUM_NODES)
+            roads.add_fragments(bitboard_tables['road_fragments'][start_position][candidate_bit(candidate)])
+
+            domains = bitboard_domains(board_state, bitboard_tables)
+            if args.reduced:
+                domains = [domain & canonical_candidates if domain is not None else None for domain in domains]
+
+            for sub_board, sub_domains, sub_roads in split_search_tree(board_state, domains, roads, bitboard_tables, args.split_depth):
+                task = {
+                    'id': len(tasks),
+                    'subtree': subtree_id(sub_board),
+                    'board_state': sub_board,
+                    'domains': sub_domains,
+                    'uf_structure': sub_roads,
+                }
+                if SOLVER_ENGINE == "list":
+                    task['node_states'], task['available_pieces'], task['domains'], task['uf_structure'] = build_list_engine_state(sub_board, game_tiles, tile_connections, connections_candidates)
+                tasks.append(task)
+
+    worker_context = {
+        'engine': SOLVER_ENGINE,
+        'game_tiles': game_tiles,
+        'tile_connections': tile_connections,
+        'connections_candidates': connections_candidates,
+        'bitboard_tables': bitboard_tables,
+        'batch_tables': batch_tables,
+        'symmetry_periods': symmetry_periods,
+        'stats_only': args.stats_only,
+        'joint_counts': args.joint_counts,
+        'packed': args.packed,
+    }
 
-    cpu_count = os.cpu_count()
-    print(f"Distributing {len(tasks)} tasks across {cpu_count} CPU cores...")
+    if args.fresh and os.path.isdir(TEMP_DIR):
+        shutil.rmtree(TEMP_DIR)
     os.makedirs(TEMP_DIR, exist_ok=True)
+
+    completed = load_manifest(args.split_depth, {'reduced': args.reduced, 'stats_only': args.stats_only, 'joint_counts': args.joint_counts, 'packed': args.packed})
+    pending_tasks = [task for task in tasks if task['subtree'] not in completed]
+    if completed:
+        print(f"♻️ Resuming: {len(completed)} of {len(tasks)} subtrees were already finished.")
+
+    print(f"Distributing {len(pending_tasks)} tasks across {args.workers} worker processes...")
     
-    with multiprocessing.Pool(cpu_count) as pool:
-        results = pool.map(solve_for_task, tasks)
+    results = []
+    progress_step = max(1, len(pending_tasks) // 100)
+    with multiprocessing.Pool(args.workers, initializer=init_worker, initargs=(worker_context,)) as pool:
+        # chunksize=1 makes the pool behave as a shared queue: an idle worker
+        # always pulls the next pending subtree
+        for result in pool.imap_unordered(solve_for_task, pending_tasks, chunksize=1):
+            append_manifest_entry({
+                'subtree': result['subtree'],
+                'part': result['part'],
+                'solutions_found': result['solutions_found'],
+                'layouts_represented': result['layouts_represented'],
+                'duration': result['duration'],
+            })
+            results.append(result)
+            if len(results) % progress_step == 0 or len(results) == len(pending_tasks):
+                elapsed = time.time() - global_start_time
+                print(f"⏳ [{len(results)}/{len(pending_tasks)}] subtrees finished ({elapsed:.0f}s elapsed)")
 
-    total_solutions = sum(r['solutions_found'] for r in results)
+    total_solutions = sum(r['solutions_found'] for r in results) + sum(entry['solutions_found'] for entry in completed.values())
     
-    final_parquet_path = get_next_filename("generated_solutions", "tiling_solutions")
-    merge_parquet_files(TEMP_DIR, final_parquet_path)
+    if args.stats_only:
+        histograms, stat_tuples = merge_stats_parts(TEMP_DIR, manifest_path=MANIFEST_PATH)
+        os.makedirs(os.path.dirname(PERCENTILES_PATH), exist_ok=True)
+        with open(PERCENTILES_PATH, 'w') as f:
+            json.dump(histograms_to_percentiles(histograms), f, indent=2)
+        print(f"✅ Percentiles written to '{PERCENTILES_PATH}'.")
+        if args.joint_counts:
+            stat_tuples_path = get_next_filename("generated_solutions", "stat_tuples")
+            write_stat_tuples(stat_tuples, stat_tuples_path)
+            print(f"✅ {len(stat_tuples):,} stat combinations written to '{stat_tuples_path}'.")
+    else:
+        final_parquet_path = get_next_filename("generated_solutions", "tiling_solutions")
+        merge_parquet_files(TEMP_DIR, final_parquet_path, manifest_path=MANIFEST_PATH, packed=args.packed)
 
     total_duration = time.time() - global_start_time
 
@@ -220,29 +415,46 @@ def main():
     # Sorts results by start time (helps visualize chronological order)
     results_sorted = sorted(results, key=lambda x: x['start_time'])
     
-    print(f"{'TASK':<8} | {'PID (CORE)':<10} | {'START (s)':<12} | {'DURATION (s)':<12} | {'SOLUTIONS'}")
-    print("-" * 74)
-    
     chart_data = []
+    core_busy_time = defaultdict(float)
+    core_task_count = defaultdict(int)
 
     for r in results_sorted:
         relative_start = r['start_time'] - global_start_time
-        
-        print(f"Task {r['worker_id']:02d} | PID {r['pid']:<6} | Started at {relative_start:5.2f}s | Duration: {r['duration']:7.2f}s | {r['solutions_found']:,}")
+        core_busy_time[r['pid']] += r['duration']
+        core_task_count[r['pid']] += 1
         
         chart_data.append({
             "Task": r['worker_id'],
+            "Subtree": r['subtree'],
             "Core_PID": r['pid'],
             "Start": relative_start,
             "Duration": r['duration']
         })
 
+    print(f"{'PID (CORE)':<10} | {'TASKS':<8} | {'BUSY (s)':<12} | {'UTILIZATION'}")
+    print("-" * 74)
+    for pid in sorted(core_busy_time):
+        print(f"PID {pid:<6} | {core_task_count[pid]:<8} | {core_busy_time[pid]:12.2f} | {core_busy_time[pid] / total_duration:7.1%}")
+
+    total_cpu_time = sum(core_busy_time.values())
+    print(f"\nTotal CPU time: {total_cpu_time:.2f}s | Ideal wall time on {args.workers} workers: {total_cpu_time / args.workers:.2f}s")
+
+    roads_scored = sum(r['roads_scored'] for r in results)
+    roads_evaluated = sum(r['roads_evaluated'] for r in results)
+    if roads_scored:
+        print(f"Road stats cache: {roads_scored:,} roads scored, {roads_evaluated:,} sequences evaluated "
+              f"(hit rate {1 - roads_evaluated / roads_scored:.2%})")
+
     with open("gantt_chart_data.json", "w") as f:
         json.dump(chart_data, f, indent=4)
 
     print("\n-------------------------------------------")
     print(f"✅ Execution finished!")
     print(f"🧩 Total solutions found: {total_solutions:,}")
+    if args.reduced:
+        total_layouts = sum(r['layouts_represented'] for r in results) + sum(entry['layouts_represented'] for entry in completed.values())
+        print(f"🔁 Reduced layouts: {total_solutions:,}, standing for {total_layouts:,} layouts")
     print(f"⏱️ Absolute Total Time: {total_duration:.2f} seconds ({(total_duration/60):.2f} minutes)")
     print("-------------------------------------------")
 
@@ -0,0 +1,81 @@
+# pareto_binary.py
+"""
+Compact binary form of pareto_front.json (generate_pareto.py --binary).
+
+Each frontier board is stored as its 8-byte layout code (layout_codec) and
+its scores as one byte per card, so a board takes 9 to 11 bytes instead of
+about 100 in JSON. All numbers are little-endian:
+
+    header    magic b"NTPF", uint32 version, uint32 combinations, uint32 boards
+    combos    per combination: uint8 card count, uint8 card numbers x3 (0-padded)
+    offsets   uint32 x (combinations + 1): first board of each combination
+    padding   zero bytes up to a multiple of 8
+    codes     uint64 x boards, grouped by combination
+    scores    uint8, per combination: boards x card count, board by board
+
+Combinations come in the order of the JSON file. read_pareto_binary (and
+docs/js/pareto_binary.js in the browser) turns the file back into the same
+{"3_7": [{"scores": [...], "board": [[piece, side, orient] x 9]}, ...]} dict.
+"""
+import numpy as np
+
+from layout_codec import encode_layouts, decode_layouts
+
+MAGIC = b"NTPF"
+VERSION = 1
+HEADER_DTYPE = np.dtype([('magic', 'S4'), ('version', '<u4'), ('combinations', '<u4'), ('boards', '<u4')])
+MAX_CARDS = 3
+
+
+def write_pareto_binary(pareto_library, file_path):
+    """Writes a pareto_front.json dictionary to file_path in the binary format."""
+    combos = np.zeros((len(pareto_library), MAX_CARDS + 1), dtype=np.uint8)
+    offsets = np.zeros(len(pareto_library) + 1, dtype='<u4')
+    boards, scores = [], []
+    for i, (combo_key, solutions) in enumerate(pareto_library.items()):
+        cards = [int(card) for card in combo_key.split("_")]
+        combos[i, 0] = len(cards)
+        combos[i, 1:1 + len(cards)] = cards
+        offsets[i + 1] = offsets[i] + len(solutions)
+        boards.extend(solution["board"] for solution in solutions)
+        scores.extend(solution["scores"] for solution in solutions)
+
+    header = np.array([(MAGIC, VERSION, len(pareto_library), len(boards))], dtype=HEADER_DTYPE)
+    codes = encode_layouts(np.array(boards, dtype=np.uint8).reshape(-1, 27)).astype('<u8')
+    flat_scores = np.array([value for row in scores for value in row], dtype=np.uint8)
+
+    with open(file_path, 'wb') as f:
+        for part in (header, combos, offsets):
+            f.write(part.tobytes())
+        f.write(b"\0" * (-f.tell() % 8))
+        f.write(codes.tobytes())
+        f.write(flat_scores.tobytes())
+
+
+def read_pareto_binary(file_path):
+    """Reads a file written by write_pareto_binary back into the pareto_front.json dictionary."""
+    data = np.fromfile(file_path, dtype=np.uint8)
+    header = data[:HEADER_DTYPE.itemsize].view(HEADER_DTYPE)[0]
+    if header['magic'] != MAGIC or header['version'] != VERSION:
+        raise ValueError(f"'{file_path}' is not a version {VERSION} Pareto binary file")
+    num_combos, num_boards = int(header['combinations']), int(header['boards'])
+
+    position = HEADER_DTYPE.itemsize
+    combos = data[position:position + num_combos * (MAX_CARDS + 1)].reshape(num_combos, MAX_CARDS + 1)
+    position += combos.size
+    offsets = data[position:position + (num_combos + 1) * 4].view('<u4')
+    position += offsets.nbytes
+    position += -position % 8
+    codes = data[position:position + num_boards * 8].view('<u8')
+    position += codes.nbytes
+    boards = decode_layouts(codes).reshape(num_boards, 9, 3).tolist()
+
+    pareto_library = {}
+    for i in range(num_combos):
+        num_cards = int(combos[i, 0])
+        start, stop = int(offsets[i]), int(offsets[i + 1])
+        scores = data[position:position + (stop - start) * num_cards].reshape(-1, num_cards).tolist()
+        position += (stop - start) * num_cards
+        combo_key = "_".join(str(card) for card in combos[i, 1:1 + num_cards].tolist())
+        pareto_library[combo_key] = [{"scores": row, "board": board} for row, board in zip(scores, boards[start:stop])]
+    return pareto_library
@@ -5,6 +5,14 @@ import os, re
 import json
 import sys
 import time
+import argparse
+import hashlib
+import multiprocessing
+import numpy as np
+import shutil
+
+from json_shards import SHARD_INDEX_FILE, write_json_shards
+from layout_codec import LAYOUT_CODE_COLUMN, encode_layouts, decode_layouts
 
 # =============================================================================
 # CONFIGURAÇÃO
@@ -15,10 +23,30 @@ SOURCE_SOLUTIONS_DIR = 'generated_solutions'
 # O diretório de saída para os arquivos JSON finais
 SOLUTIONS_OUTPUT_DIR = 'docs/data'
 DATABASES_OUTPUT_DIR = 'databases'
-TEMP_DIR = 'temp'
 
 # O único arquivo de banco de dados usado para todo o processamento
 MAIN_DB_PATH = os.path.join(DATABASES_OUTPUT_DIR, 'solutions.duckdb')
+# Entradas e saídas de cada etapa da última execução, para só refazer as desatualizadas
+STAGE_MANIFEST_PATH = os.path.join(DATABASES_OUTPUT_DIR, 'post_process_stages.json')
+BEST_SOLUTIONS_JSON_PATH = os.path.join(SOLUTIONS_OUTPUT_DIR, 'best_solutions.json')
+PERCENTILES_JSON_PATH = os.path.join(SOLUTIONS_OUTPUT_DIR, 'percentiles.json')
+TOP_SOLUTIONS_JSON_PATH = os.path.join(SOLUTIONS_OUTPUT_DIR, 'top_solutions.json')
+# Com --sharded, best_solutions.json também sai dividido pela primeira carta (json_shards)
+BEST_SOLUTIONS_SHARDS_DIR = os.path.join(SOLUTIONS_OUTPUT_DIR, 'best_solutions')
+# Soluções guardadas por combinação de cartas em top_solutions.json
+TOP_K = 10
+
+# Redutor das melhores soluções: cada tarefa do pool cobre uma faixa de linhas do arquivo,
+# lida em lotes; as linhas únicas de cada lote são comparadas com todas as
+# combinações de cartas em blocos pequenos (o bloco dos trios ocupa ~40 MB)
+REDUCER_TASK_ROWS = 1 << 24
+REDUCER_BATCH_ROWS = 1 << 20
+REDUCER_BLOCK_ROWS = 2048
+# Linhas candidatas (k por posição do top-K) abertas de uma vez ao devolver os
+# empates de cada lote: limita a memória a ~32 MB mesmo com --top-k alto
+REDUCER_TIE_CELLS = 1 << 22
+
+LAYOUT_COLUMNS = [f"{kind}_{r}{c}" for r in range(3) for c in range(3) for kind in ("piece", "side", "orient")]
 
 STAT_COLUMNS = [
     "total_houses", "total_girls", "total_boys", "total_dogs",
@@ -54,6 +82,86 @@ def find_latest_solution_file(directory, base_name="tiling_solutions", extension
     else:
         return None, f"Nenhum arquivo de solução (ex: '{base_name}_1.{extension}') encontrado em '{directory}'."
 
+# =============================================================================
+# MANIFESTO DE ETAPAS
+# =============================================================================
+
+def fingerprint_parquet(parquet_file_path):
+    """Identifica o conteúdo de um Parquet sem lê-lo: caminho, tamanho, linhas e hash do rodapé de metadados."""
+    size = os.path.getsize(parquet_file_path)
+    with open(parquet_file_path, 'rb') as f:
+        # O arquivo termina com [metadados][tamanho dos metadados (4 bytes)]['PAR1']
+        f.seek(size - 8)
+        footer_length = int.from_bytes(f.read(4), 'little')
+        f.seek(size - 8 - footer_length)
+        footer = f.read(footer_length)
+    rows = duckdb.execute(f"SELECT COUNT(*) FROM read_parquet('{parquet_file_path}')").fetchone()[0]
+    return {
+        'path': os.path.abspath(parquet_file_path),
+        'size': size,
+        'rows': rows,
+        'metadata_sha256': hashlib.sha256(footer).hexdigest(),
+    }
+
+def fingerprint_cards(game_cards):
+    """Hash só do que muda a pontuação (número, estatística e tipo de cada carta)."""
+    scoring = sorted((card['number'], card['key'], card['type']) for card in game_cards if card.get('key'))
+    return hashlib.sha256(json.dumps(scoring).encode()).hexdigest()
+
+def fingerprint_file(path):
+    if not os.path.exists(path):
+        return None
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+def fingerprint_best_solutions(sharded=False):
+    """Hashes de best_solutions.json, top_solutions.json e, com sharded, do índice dos fragmentos (None se faltar algum)."""
+    paths = [BEST_SOLUTIONS_JSON_PATH, TOP_SOLUTIONS_JSON_PATH]
+    if sharded:
+        paths.append(os.path.join(BEST_SOLUTIONS_SHARDS_DIR, SHARD_INDEX_FILE))
+    hashes = [fingerprint_file(path) for path in paths]
+    return None if None in hashes else hashes
+
+def fingerprint_percentiles():
+    """Hash do conteúdo da tabela 'stat_percentiles' (None se ela não existir)."""
+    if not os.path.exists(MAIN_DB_PATH):
+        return None
+    con = duckdb.connect(MAIN_DB_PATH, read_only=True)
+    try:
+        rows = con.execute("SELECT stat_name, stat_value, frequency, percentile FROM stat_percentiles ORDER BY stat_name, stat_value").fetchall()
+    except duckdb.Error:
+        return None
+    finally:
+        con.close()
+    return hashlib.sha256(repr(rows).encode()).hexdigest()
+
+def solutions_view_exists():
+    if not os.path.exists(MAIN_DB_PATH):
+        return False
+    con = duckdb.connect(MAIN_DB_PATH, read_only=True)
+    try:
+        return 'solutions' in [row[0] for row in con.execute("SELECT view_name FROM duckdb_views();").fetchall()]
+    finally:
+        con.close()
+
+def load_stage_manifest():
+    if not os.path.exists(STAGE_MANIFEST_PATH):
+        return {}
+    with open(STAGE_MANIFEST_PATH, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def stage_is_current(manifest, stage, inputs, output):
+    """Uma etapa só é pulada se rodou com as mesmas entradas e a saída dela ainda é a que foi registrada."""
+    entry = manifest.get(stage)
+    return entry is not None and entry['inputs'] == inputs and output is not None and entry['output'] == output
+
+def record_stage(manifest, stage, inputs, output):
+    """Registra a etapa concluída e grava o manifesto na hora, para valer mesmo se a próxima etapa falhar."""
+    manifest[stage] = {'inputs': inputs, 'output': output}
+    os.makedirs(DATABASES_OUTPUT_DIR, exist_ok=True)
+    with open(STAGE_MANIFEST_PATH, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+
 # =============================================================================
 # FUNÇÕES DE PROCESSAMENTO DE DADOS
 # =============================================================================
@@ -65,28 +173,29 @@ def create_db_from_parquet(parquet_file_path):
     con.execute(f"PRAGMA threads={os.cpu_count()};")
     con.execute("PRAGMA enable_progress_bar=true;")
 
-    try:
-        views_df = con.execute("SELECT view_name FROM duckdb_views();").fetchdf()
-        view_exists = 'solutions' in views_df['view_name'].values
-    except duckdb.Error:
-        view_exists = False
-
-    if view_exists:
-        print(f"✅ View 'solutions' já existe em '{MAIN_DB_PATH}'. Pulando a criação.")
-        con.close()
-        return
-
     print(f"🚀 Criando uma VIEW otimizada 'solutions' para '{parquet_file_path}'...")
-    all_parquet_columns = STAT_COLUMNS[:]
-    for r in range(3):
-        for c in range(3):
-            pos = f"{r}{c}"
-            all_parquet_columns.extend([f"piece_{pos}", f"side_{pos}", f"orient_{pos}"])
-    
-    select_clauses = ["ROW_NUMBER() OVER ()duckdb  AS solution_id"]
-    for col in all_parquet_columns:
+    parquet_columns = [row[0] for row in con.execute(f"DESCRIBE SELECT * FROM read_parquet('{parquet_file_path}')").fetchall()]
+
+    select_clauses = ["ROW_NUMBER() OVER () AS solution_id"]
+    for col in STAT_COLUMNS:
         select_clauses.append(f'CAST("{col}" AS UTINYINT) AS "{col}"')
+
+    # Arquivos compactados (main.py --packed) trazem o tabuleiro inteiro num único
+    # uint64, decodificado só na exportação (layout_codec.decode_layouts)
+    if LAYOUT_CODE_COLUMN in parquet_columns:
+        select_clauses.append(f'CAST("{LAYOUT_CODE_COLUMN}" AS UBIGINT) AS "{LAYOUT_CODE_COLUMN}"')
+    else:
+        for col in LAYOUT_COLUMNS:
+            select_clauses.append(f'CAST("{col}" AS UTINYINT) AS "{col}"')
     
+    # Execuções reduzidas (main.py --reduced) guardam só a menor das orientações
+    # equivalentes de cada peça e quantos layouts cada linha representa, e
+    # stat_tuples_N.parquet um por vetor de estatísticas; execuções completas valem 1 cada
+    if "multiplicity" in parquet_columns:
+        select_clauses.append('CAST("multiplicity" AS UBIGINT) AS "multiplicity"')
+    else:
+        select_clauses.append('CAST(1 AS UBIGINT) AS "multiplicity"')
+
     select_clauses_sql = ", ".join(select_clauses)
     
     create_view_query = f"""
@@ -121,7 +230,7 @@ def calculate_percentiles():
     unpivot_query = f"""
             INSERT INTO stat_percentiles
             WITH ValueCounts AS (
-                SELECT stat_name, stat_value, COUNT(*) as frequency
+                SELECT stat_name, stat_value, SUM(multiplicity) as frequency
                 FROM (UNPIVOT solutions ON {stat_columns_list} INTO NAME stat_name VALUE stat_value) AS unpivoted_data
                 GROUP BY stat_name, stat_value
             )
@@ -142,52 +251,6 @@ def calculate_percentiles():
     con.close()
     print(f"✅ Tabela 'stat_percentiles' salva em '{MAIN_DB_PATH}'.")
 
-def precompute_all_scores(game_cards):
-    print("\n🚀 Pré-calculando scores e salvando em 'solutions.duckdb'...")
-    con = duckdb.connect(MAIN_DB_PATH, read_only=False)
-    con.execute("PRAGMA memory_limit='20GB';")
-    con.execute(f"PRAGMA threads={os.cpu_count()};")
-    con.execute("PRAGMA enable_progress_bar=true;")
-    os.makedirs(TEMP_DIR, exist_ok=True)
-    con.execute(f"PRAGMA temp_directory='{TEMP_DIR}';")
-    
-    # Não precisa mais de ATTACH, a tabela já está no banco de dados principal
-    con.execute("DROP TABLE IF EXISTS solution_scores;")
-    scorable_cards = [card for card in game_cards if card.get('key')]
-    
-    select_clauses = ["s.solution_id"]
-    join_clauses = []
-    for i, card in enumerate(scorable_cards):
-        key, card_num, card_type = card['key'], card['number'], card['type']
-        alias = f"p{i}"
-        score_logic = f"{alias}.percentile" if card_type == 'max' else f"100.0 - {alias}.percentile"
-        select_clauses.append(f"CAST({score_logic} AS REAL) AS card_{card_num}_score")
-        # A referência ao banco de dados 'percentiles_db' foi removida
-        join_clauses.append(f"""LEFT JOIN stat_percentiles AS {alias} ON s."{key}" = {alias}.stat_value AND {alias}.stat_name = '{key}'""")
-        
-    select_sql = ", ".join(select_clauses)
-    join_sql = "\n".join(join_clauses)
-    score_columns = [f"card_{card['number']}_score" for card in scorable_cards]
-    num_scorable_cards = len(score_columns)
-    
-    clean_scores = [f"GREATEST(0, COALESCE({col}, 0))" for col in score_columns]
-    zero_check_sql = " OR ".join([f"{cs} <= 0.0001" for cs in clean_scores]) # Adicionado <= para maior robustez
-    log_sum_sql = " + ".join([f"LN({cs})" for cs in clean_scores])
-    stable_geometric_mean_sql = f"EXP(({log_sum_sql}) / {float(num_scorable_cards)})"
-    
-    super_score_sql = f"CASE WHEN {zero_check_sql} THEN 0.0 ELSE {stable_geometric_mean_sql} END"
-
-    full_query = f"""
-        CREATE TABLE solution_scores AS
-        WITH ScoredSolutions AS (SELECT {select_sql} FROM solutions s {join_sql})
-        SELECT *, CAST({super_score_sql} AS REAL) AS super_score FROM ScoredSolutions;
-    """
-    
-    print("  -> Executando query para criar a tabela 'solution_scores'. Isso pode levar um tempo...")
-    con.execute(full_query)
-    con.close()
-    print("✅ Tabela 'solution_scores' criada com sucesso em 'solutions.duckdb'.")
-
 def _solutions_df_to_json_dict(df, key_cols):
     """Converte um DataFrame de soluções para o formato de dicionário JSON desejado."""
     solutions_dict = {}
@@ -199,101 +262,294 @@ def _solutions_df_to_json_dict(df, key_cols):
         solutions_dict[key] = solution_data
     return solutions_dict
 
-def find_and_export_best_solutions_as_json(game_cards):
-    """Encontra as melhores soluções e exporta os resultados como arquivos JSON."""
+def _fetch_layouts(con, parquet_file_path, rows):
+    """Busca os tabuleiros das linhas pedidas do arquivo, já com as 27 colunas de layout (decodificando arquivos compactados)."""
+    rows_sql = ','.join(map(str, rows))
+    source = f"read_parquet('{parquet_file_path}', file_row_number=true)"
+    parquet_columns = [row[0] for row in con.execute(f"DESCRIBE SELECT * FROM read_parquet('{parquet_file_path}')").fetchall()]
+    if LAYOUT_CODE_COLUMN not in parquet_columns:
+        layout_columns_str = ", ".join(f'"{col}"' for col in LAYOUT_COLUMNS)
+        return con.execute(f"SELECT file_row_number, {layout_columns_str} FROM {source} WHERE file_row_number IN ({rows_sql})").fetchdf()
+
+    codes_df = con.execute(f'SELECT file_row_number, "{LAYOUT_CODE_COLUMN}" FROM {source} WHERE file_row_number IN ({rows_sql})').fetchdf()
+    details_df = pd.DataFrame(decode_layouts(codes_df[LAYOUT_CODE_COLUMN].to_numpy()), columns=LAYOUT_COLUMNS)
+    details_df.insert(0, 'file_row_number', codes_df['file_row_number'].to_numpy())
+    return details_df
+
+def build_log_score_tables(con, scorable_cards):
+    """
+    Compila 'stat_percentiles' em uma tabela de 256 posições por carta: o log do
+    score da carta para cada valor da sua estatística (percentil para cartas
+    'max', 100 - percentil para 'min', em REAL como antes; score zero vira -inf).
+    Devolve (estatísticas lidas, coluna de cada carta nessa lista, tabelas).
+    """
+    stat_keys = sorted({card['key'] for card in scorable_cards})
+    percentiles = {key: np.zeros(256, dtype=np.float64) for key in stat_keys}
+    for stat_name, stat_value, percentile in con.execute("SELECT stat_name, stat_value, percentile FROM stat_percentiles").fetchall():
+        if stat_name in percentiles:
+            percentiles[stat_name][stat_value] = percentile
+
+    scores = np.empty((len(scorable_cards), 256), dtype=np.float32)
+    for i, card in enumerate(scorable_cards):
+        card_percentiles = percentiles[card['key']]
+        scores[i] = card_percentiles if card['type'] == 'max' else 100.0 - card_percentiles
+    with np.errstate(divide='ignore'):
+        log_tables = np.log(np.maximum(scores, 0).astype(np.float64))
+    card_columns = np.array([stat_keys.index(card['key']) for card in scorable_cards], dtype=np.intp)
+    return stat_keys, card_columns, log_tables
+
+# Linha fictícia das posições ainda vazias do top-K: fica atrás de qualquer linha real
+EMPTY_ROW = np.iinfo(np.int64).max
+
+def _empty_top_k(combos, k):
+    """
+    Top-K vazio de cada tamanho de combinação: {tamanho: (somas de logs,
+    linhas)}, as duas (k, combinações).
+    """
+    return {size: (np.full((k, len(indices)), -np.inf),
+                   np.full((k, len(indices)), EMPTY_ROW, dtype=np.int64))
+            for size, indices in combos.items()}
+
+def _merge_top_k(logs_a, rows_a, logs_b, rows_b, k):
+    """
+    Junta dois top-K por coluna (combinação), ordenando pela maior soma de logs
+    e, nos empates, pela primeira linha. As linhas de lotes e processos
+    diferentes nunca se repetem, então a junção vale em qualquer ordem.
+    """
+    logs = np.concatenate((logs_a, logs_b))
+    rows = np.concatenate((rows_a, rows_b))
+    order = np.lexsort((rows, -logs), axis=0)[:k]
+    return np.take_along_axis(logs, order, axis=0), np.take_along_axis(rows, order, axis=0)
+
+def _expand_ties(logs, groups, grouped_positions, group_starts, group_sizes, k):
+    """
+    Troca o top-K de estatísticas únicas de um lote pelo top-K de linhas:
+    cada grupo (conjunto de estatísticas) entra com até k das suas linhas, em
+    ordem, e fica o melhor de tudo por (soma de logs, linha). As k melhores
+    linhas sempre saem dos k melhores grupos, porque a primeira linha de cada
+    um deles vem antes delas. grouped_positions traz as posições do lote
+    agrupadas por grupo, group_starts e group_sizes onde cada grupo começa
+    nela e quantas tem. Devolve (somas de logs, posições no lote).
+    """
+    filled = groups != EMPTY_ROW
+    groups = np.where(filled, groups, 0)
+    offsets = np.arange(k)
+    # (posição do top-K, combinação, k-ésima linha do grupo)
+    valid = filled[:, :, None] & (offsets < group_sizes[groups][:, :, None])
+    positions = grouped_positions[np.where(valid, group_starts[groups][:, :, None] + offsets, 0)]
+    positions = np.where(valid, positions, EMPTY_ROW).transpose(0, 2, 1).reshape(k * k, -1)
+    candidate_logs = np.where(valid, logs[:, :, None], -np.inf).transpose(0, 2, 1).reshape(k * k, -1)
+    order = np.lexsort((positions, -candidate_logs), axis=0)[:k]
+    return np.take_along_axis(candidate_logs, order, axis=0), np.take_along_axis(positions, order, axis=0)
+
+def _block_top_k(sums, k):
+    """Índices das k maiores somas de cada coluna de um bloco; nos empates, as linhas mais acima."""
+    if len(sums) <= k:
+        return np.argsort(-sums, axis=0, kind='stable')
+    threshold = np.partition(sums, len(sums) - k, axis=0)[len(sums) - k]
+    above = sums > threshold
+    ties = sums == threshold
+    selected = above | (ties & (np.cumsum(ties, axis=0) <= k - above.sum(axis=0)))
+    return np.argsort(~selected, axis=0, kind='stable')[:k]
+
+def _reduce_solution_range(task):
+    """
+    Lê uma única vez as estatísticas das linhas [start, stop) do arquivo de
+    soluções, pontua cada uma pelas tabelas de build_log_score_tables e
+    devolve, para cada tamanho de combinação, o top-K de _empty_top_k: as k
+    maiores somas de logs dos scores de cada combinação e a linha de cada
+    uma. A soma de logs ordena as soluções igual à média geométrica (um score
+    zero vira -inf).
+    """
+    parquet_file_path, start, stop, stat_keys, card_columns, log_tables, combos, k = task
+    top = _empty_top_k(combos, k)
+    card_range = np.arange(len(card_columns))[None, :]
+
+    con = duckdb.connect()
+    con.execute("PRAGMA threads=1;")
+    columns_sql = ", ".join(f'"{key}"' for key in stat_keys)
+    reader = con.execute(f"""
+        SELECT file_row_number, {columns_sql} FROM read_parquet('{parquet_file_path}', file_row_number=true)
+        WHERE file_row_number >= {start} AND file_row_number < {stop}
+    """).to_arrow_reader(REDUCER_BATCH_ROWS)
+
+    for batch in reader:
+        row_numbers = batch.column(0).to_numpy()
+        stats = np.column_stack([batch.column(i + 1).to_numpy() for i in range(len(stat_keys))]).astype(np.uint8)
+
+        # Soluções com as mesmas estatísticas empatam em todas as combinações: cada
+        # grupo é avaliado uma vez, pela sua primeira linha, e os empates voltam no fim
+        keys = np.ascontiguousarray(stats).view(np.dtype((np.void, stats.shape[1]))).ravel()
+        _, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+        by_first = np.argsort(first)
+        group_of_row = np.empty_like(by_first)
+        group_of_row[by_first] = np.arange(len(by_first))
+        group_of_row = group_of_row[inverse.ravel()]
+        # Posições do lote agrupadas por grupo, cada grupo em ordem de linha
+        grouped_positions = np.argsort(group_of_row, kind='stable')
+        group_sizes = np.bincount(group_of_row, minlength=len(first))
+        group_starts = np.concatenate(([0], np.cumsum(group_sizes)[:-1]))
+        logs = log_tables[card_range, stats[first[by_first]][:, card_columns]]
+
+        # Top-K do lote por grupo
+        batch_logs = {size: np.full((k, len(indices)), -np.inf) for size, indices in combos.items()}
+        batch_groups = {size: np.full((k, len(indices)), EMPTY_ROW, dtype=np.int64) for size, indices in combos.items()}
+        for block_start in range(0, len(logs), REDUCER_BLOCK_ROWS):
+            block_logs = logs[block_start:block_start + REDUCER_BLOCK_ROWS]
+            for size, indices in combos.items():
+                sums = block_logs[:, indices[:, 0]]
+                for i in range(1, size):
+                    sums = sums + block_logs[:, indices[:, i]]
+                best = _block_top_k(sums, k)
+                batch_logs[size], batch_groups[size] = _merge_top_k(
+                    batch_logs[size], batch_groups[size], np.take_along_axis(sums, best, axis=0), best + block_start, k)
+
+        combos_per_step = max(1, REDUCER_TIE_CELLS // (k * k))
+        for size in combos:
+            for step in range(0, batch_logs[size].shape[1], combos_per_step):
+                columns = slice(step, step + combos_per_step)
+                tie_logs, positions = _expand_ties(batch_logs[size][:, columns], batch_groups[size][:, columns],
+                                                   grouped_positions, group_starts, group_sizes, k)
+                filled = positions != EMPTY_ROW
+                rows = np.where(filled, row_numbers[np.where(filled, positions, 0)], EMPTY_ROW)
+                top_logs, top_rows = top[size]
+                top_logs[:, columns], top_rows[:, columns] = _merge_top_k(top_logs[:, columns], top_rows[:, columns], tie_logs, rows, k)
+
+    con.close()
+    return top
+
+def find_top_solution_rows(parquet_file_path, scorable_cards, k=1):
+    """
+    As k melhores linhas do arquivo de soluções para cada combinação de 1, 2 e
+    3 cartas, com uma única leitura do arquivo dividida entre processos. Os
+    scores são calculados na hora a partir dos percentis, sem tabela
+    intermediária. Empates ficam na ordem das linhas. Devolve {tamanho: (combinações de card ids, somas de logs,
+    linhas)}, as duas últimas (k, combinações), da melhor para a pior; posições
+    sem solução ficam com EMPTY_ROW.
+    """
+    con = duckdb.connect(MAIN_DB_PATH, read_only=True)
+    stat_keys, card_columns, log_tables = build_log_score_tables(con, scorable_cards)
+    con.close()
+
+    card_ids = [card['number'] for card in scorable_cards]
+    combos = {size: np.array(list(itertools.combinations(range(len(card_ids)), size)), dtype=np.intp)
+              for size in (1, 2, 3) if size <= len(card_ids)}
+    num_rows = duckdb.execute(f"SELECT COUNT(*) FROM read_parquet('{parquet_file_path}')").fetchone()[0]
+    tasks = [(parquet_file_path, start, start + REDUCER_TASK_ROWS, stat_keys, card_columns, log_tables, combos, k)
+             for start in range(0, num_rows, REDUCER_TASK_ROWS)]
+
+    top = _empty_top_k(combos, k)
+    print(f"  -> Avaliando {sum(len(c) for c in combos.values())} combinações (top {k}) em {len(tasks)} faixas de soluções...")
+    with multiprocessing.Pool(min(os.cpu_count(), len(tasks)) or 1) as pool:
+        for done, task_top in enumerate(pool.imap_unordered(_reduce_solution_range, tasks), start=1):
+            for size in combos:
+                top[size] = _merge_top_k(*top[size], *task_top[size], k)
+            print(f"  -> Faixa {done}/{len(tasks)} concluída.")
+
+    return {size: ([tuple(card_ids[i] for i in combo) for combo in indices], top[size][0], top[size][1])
+            for size, indices in combos.items()}
+
+def find_and_export_best_solutions_as_json(parquet_file_path, game_cards, top_k=TOP_K, sharded=False):
+    """
+    Encontra as melhores soluções e exporta os resultados como arquivos JSON:
+    best_solutions.json com a melhor de cada combinação e top_solutions.json
+    com as top_k melhores, {combinação: [[score, layout_code], ...]}, o score
+    sendo a média geométrica dos scores das cartas e o layout_code o de
+    layout_codec (cabe num número do JSON sem perder precisão). Com sharded,
+    best_solutions.json também é gravado em BEST_SOLUTIONS_SHARDS_DIR, um
+    arquivo por primeira carta, para o site baixar só o que usa; sem ele,
+    fragmentos de uma exportação anterior são apagados.
+    """
     print("\n🚀 Encontrando melhores soluções e preparando para exportação JSON...")
+
+    scorable_cards = sorted([card for card in game_cards if card.get('key')], key=lambda card: card['number'])
+    top_by_size = find_top_solution_rows(parquet_file_path, scorable_cards, top_k)
     
     con = duckdb.connect(MAIN_DB_PATH, read_only=True)
     con.execute("PRAGMA memory_limit='20GB';")
     con.execute(f"PRAGMA threads={os.cpu_count()};")
     con.execute("PRAGMA enable_progress_bar=true;")
 
-    scorable_card_ids = sorted([card['number'] for card in game_cards if card.get('key')])
-    layout_columns_str = ", ".join([f's."piece_{r}{c}", s."side_{r}{c}", s."orient_{r}{c}"' for r in range(3) for c in range(3)])
+    unique_rows = {int(row) for _, _, rows in top_by_size.values() for row in rows.ravel() if row != EMPTY_ROW}
+    details_df = _fetch_layouts(con, parquet_file_path, unique_rows).set_index('file_row_number')
+    layout_codes = dict(zip(details_df.index.tolist(), encode_layouts(details_df[LAYOUT_COLUMNS].to_numpy()).tolist()))
     
     all_solutions_json = {}
-
-    # --- 1. Melhores soluções para SINGLE cards ---
-    print("  -> Processando single cards...")
-    max_by_clauses = [f"max_by(ss.solution_id, ss.card_{cid}_score) AS id_{cid}" for cid in scorable_card_ids]
-    best_ids_df = con.execute(f"SELECT {', '.join(max_by_clauses)} FROM solution_scores ss").fetchdf()
-    unique_ids = set(best_ids_df.iloc[0].values)
-    details_df = con.execute(f"SELECT s.solution_id, {layout_columns_str} FROM solutions s WHERE s.solution_id IN ({','.join(map(str, unique_ids))})").fetchdf()
-    
-    rows = []
-    for card_id in scorable_card_ids:
-        best_id = best_ids_df[f'id_{card_id}'][0]
-        row_data = details_df[details_df['solution_id'] == best_id].iloc[0].to_dict()
-        row_data['card_id'] = card_id
-        rows.append(row_data)
-    all_solutions_json.update(_solutions_df_to_json_dict(pd.DataFrame(rows), ['card_id']))
-
-    # --- 2. Melhores soluções para PARES de cartões ---
-    print("  -> Processando card pairs...")
-    card_pairs = list(itertools.combinations(scorable_card_ids, 2))
-    if card_pairs:
-        max_by_clauses = [f"max_by(ss.solution_id, pow(ss.card_{c1}_score * ss.card_{c2}_score, 1/2.0)) AS id_{c1}_{c2}" for c1, c2 in card_pairs]
-        best_ids_df = con.execute(f"SELECT {', '.join(max_by_clauses)} FROM solution_scores ss").fetchdf()
-        unique_ids = set(best_ids_df.iloc[0].values)
-        details_df = con.execute(f"SELECT s.solution_id, {layout_columns_str} FROM solutions s WHERE s.solution_id IN ({','.join(map(str, unique_ids))})").fetchdf()
-
+    top_solutions_json = {}
+    key_cols_by_size = {1: ['card_id'], 2: ['card_id_1', 'card_id_2'], 3: ['card_id_1', 'card_id_2', 'card_id_3']}
+    for size, (card_combos, top_logs, top_rows) in top_by_size.items():
         rows = []
-        for c1, c2 in card_pairs:
-            best_id = best_ids_df[f'id_{c1}_{c2}'][0]
-            row_data = details_df[details_df['solution_id'] == best_id].iloc[0].to_dict()
-            row_data['card_id_1'], row_data['card_id_2'] = c1, c2
+        for column, card_combo in enumerate(card_combos):
+            row_data = details_df.loc[int(top_rows[0, column])].to_dict()
+            row_data.update(zip(key_cols_by_size[size], card_combo))
             rows.append(row_data)
-        all_solutions_json.update(_solutions_df_to_json_dict(pd.DataFrame(rows), ['card_id_1', 'card_id_2']))
-    
-    # --- 3. Melhores soluções para TRIOS de cartões ---
-    print("  -> Processando card trios...")
-    card_trios = list(itertools.combinations(scorable_card_ids, 3))
-    if card_trios:
-        max_by_clauses = [f"max_by(ss.solution_id, pow(ss.card_{c1}_score * ss.card_{c2}_score * ss.card_{c3}_score, 1/3.0)) AS id_{c1}_{c2}_{c3}" for c1, c2, c3 in card_trios]
-        best_ids_df = con.execute(f"SELECT {', '.join(max_by_clauses)} FROM solution_scores ss").fetchdf()
-        unique_ids = set(best_ids_df.iloc[0].values)
-        details_df = con.execute(f"SELECT s.solution_id, {layout_columns_str} FROM solutions s WHERE s.solution_id IN ({','.join(map(str, unique_ids))})").fetchdf()
 
-        rows = []
-        for c1, c2, c3 in card_trios:
-            best_id = best_ids_df[f'id_{c1}_{c2}_{c3}'][0]
-            row_data = details_df[details_df['solution_id'] == best_id].iloc[0].to_dict()
-            row_data['card_id_1'], row_data['card_id_2'], row_data['card_id_3'] = c1, c2, c3
-            rows.append(row_data)
-        all_solutions_json.update(_solutions_df_to_json_dict(pd.DataFrame(rows), ['card_id_1', 'card_id_2', 'card_id_3']))
+            scores = np.exp(top_logs[:, column] / size)
+            top_solutions_json["_".join(map(str, sorted(card_combo)))] = [
+                [round(float(score), 4), layout_codes[int(row)]]
+                for score, row in zip(scores, top_rows[:, column]) if row != EMPTY_ROW
+            ]
+        all_solutions_json.update(_solutions_df_to_json_dict(pd.DataFrame(rows), key_cols_by_size[size]))
     
     # --- Exportar best_solutions.json ---
     os.makedirs(SOLUTIONS_OUTPUT_DIR, exist_ok=True)
-    json_path = os.path.join(SOLUTIONS_OUTPUT_DIR, 'best_solutions.json')
+    json_path = BEST_SOLUTIONS_JSON_PATH
     with open(json_path, 'w') as f:
         json.dump(all_solutions_json, f)
     print(f"✅ Arquivo 'best_solutions.json' salvo em '{json_path}'.")
+    if sharded:
+        index = write_json_shards(all_solutions_json, BEST_SOLUTIONS_SHARDS_DIR)
+        print(f"✅ {len(index['shards'])} fragmentos de 'best_solutions.json' salvos em '{BEST_SOLUTIONS_SHARDS_DIR}'.")
+    elif os.path.isdir(BEST_SOLUTIONS_SHARDS_DIR):
+        shutil.rmtree(BEST_SOLUTIONS_SHARDS_DIR)
 
-    # --- Exportar percentiles.json ---
-    print("  -> Exportando percentis para JSON...")
+    # --- Exportar top_solutions.json ---
+    with open(TOP_SOLUTIONS_JSON_PATH, 'w') as f:
+        json.dump(top_solutions_json, f, separators=(',', ':'))
+    print(f"✅ Arquivo 'top_solutions.json' salvo em '{TOP_SOLUTIONS_JSON_PATH}'.")
+
+    con.close()
+
+def export_percentiles_json():
+    """Exporta a tabela 'stat_percentiles' como percentiles.json."""
+    print("\n🚀 Exportando percentis para JSON...")
+    con = duckdb.connect(MAIN_DB_PATH, read_only=True)
     percentiles_df = con.execute("SELECT stat_name, stat_value, percentile FROM stat_percentiles").fetchdf()
+    con.close()
     percentiles_json = {
         stat: dict(zip(group['stat_value'].astype(str), group['percentile']))
         for stat, group in percentiles_df.groupby('stat_name')
     }
-    json_path = os.path.join(SOLUTIONS_OUTPUT_DIR, 'percentiles.json')
-    with open(json_path, 'w') as f:
+    os.makedirs(SOLUTIONS_OUTPUT_DIR, exist_ok=True)
+    with open(PERCENTILES_JSON_PATH, 'w') as f:
         json.dump(percentiles_json, f, indent=2)
-    print(f"✅ Arquivo 'percentiles.json' salvo em '{json_path}'.")
-
-    con.close()
+    print(f"✅ Arquivo 'percentiles.json' salvo em '{PERCENTILES_JSON_PATH}'.")
 
 # =============================================================================
 # EXECUTOR PRINCIPAL (ATUALIZADO)
 # =============================================================================
 def main():
     """Orquestra todo o processo de pós-processamento."""
+    parser = argparse.ArgumentParser(description="Pós-processa as soluções geradas por main.py.")
+    parser.add_argument("--stat-tuples", action="store_true",
+                        help="usa a tabela agregada mais recente (stat_tuples_N.parquet, de build_stat_tuples.py) "
+                             "em vez de todas as soluções")
+    parser.add_argument("--force", action="store_true",
+                        help="refaz todas as etapas, mesmo as que estão em dia")
+    parser.add_argument("--top-k", type=int, default=TOP_K,
+                        help=f"soluções guardadas por combinação em top_solutions.json (padrão: {TOP_K})")
+    parser.add_argument("--sharded", action="store_true",
+                        help="também divide best_solutions.json em um arquivo por primeira carta, "
+                             f"com um índice, em '{BEST_SOLUTIONS_SHARDS_DIR}'")
+    args = parser.parse_args()
+
     start_time = time.time()
     print("=" * 50)
     print("INICIANDO SCRIPT DE PÓS-PROCESSAMENTO DE SOLUÇÕES")
     print("=" * 50)
 
-    parquet_file, error = find_latest_solution_file(SOURCE_SOLUTIONS_DIR)
+    base_name = "stat_tuples" if args.stat_tuples else "tiling_solutions"
+    parquet_file, error = find_latest_solution_file(SOURCE_SOLUTIONS_DIR, base_name=base_name)
     if error:
         print(f"❌ ERRO: {error}")
         return
@@ -307,10 +563,41 @@ def main():
         print(f"ERRO ao carregar o arquivo de cartões: {e}")
         return
 
-    create_db_from_parquet(parquet_file)
-    calculate_percentiles()
-    precompute_all_scores(game_cards)
-    find_and_export_best_solutions_as_json(game_cards)
+    # Cada etapa depende do arquivo de soluções e/ou da saída da anterior: mudar
+    # só as cartas refaz só a pontuação, trocar o arquivo refaz tudo
+    manifest = {} if args.force else load_stage_manifest()
+    source = fingerprint_parquet(parquet_file)
+
+    view_inputs = {'source': source}
+    view_output = source['metadata_sha256'] if solutions_view_exists() else None
+    if stage_is_current(manifest, 'view', view_inputs, view_output):
+        print(f"\n⏭️ View 'solutions' já aponta para '{parquet_file}'. Pulando.")
+    else:
+        create_db_from_parquet(parquet_file)
+        record_stage(manifest, 'view', view_inputs, source['metadata_sha256'])
+
+    percentiles_inputs = {'source': source}
+    if stage_is_current(manifest, 'percentiles', percentiles_inputs, fingerprint_percentiles()):
+        print("⏭️ Percentis em dia. Pulando.")
+    else:
+        calculate_percentiles()
+        record_stage(manifest, 'percentiles', percentiles_inputs, fingerprint_percentiles())
+    percentiles_output = manifest['percentiles']['output']
+
+    percentiles_json_inputs = {'percentiles': percentiles_output}
+    if stage_is_current(manifest, 'percentiles_json', percentiles_json_inputs, fingerprint_file(PERCENTILES_JSON_PATH)):
+        print("⏭️ 'percentiles.json' em dia. Pulando.")
+    else:
+        export_percentiles_json()
+        record_stage(manifest, 'percentiles_json', percentiles_json_inputs, fingerprint_file(PERCENTILES_JSON_PATH))
+
+    best_inputs = {'source': source, 'percentiles': percentiles_output, 'cards': fingerprint_cards(game_cards),
+                   'top_k': args.top_k, 'sharded': args.sharded}
+    if stage_is_current(manifest, 'best_solutions', best_inputs, fingerprint_best_solutions(args.sharded)):
+        print("⏭️ 'best_solutions.json' e 'top_solutions.json' em dia. Pulando.")
+    else:
+        find_and_export_best_solutions_as_json(parquet_file, game_cards, args.top_k, args.sharded)
+        record_stage(manifest, 'best_solutions', best_inputs, fingerprint_best_solutions(args.sharded))
 
     end_time = time.time()
     print("\n" + "=" * 50)
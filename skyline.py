@@ -0,0 +1,94 @@
+# skyline.py
+"""
+Pareto frontier (skyline) of small integer score matrices, shared by
+generate_pareto.py and verify_winner_trio.py.
+
+skyline(points, maximize) takes an (N, d) integer matrix, one column per
+objective, and a list telling for each objective whether higher (True) or
+lower (False) is better. It returns the sorted row indices of the points no
+other point dominates. Equal points do not dominate each other, so duplicates
+are all kept.
+
+Card stats are uint8 and a combination has at most 3 objectives, so the usual
+path is a suffix-max table over the value grid: for every cell of the first
+d-1 objectives, the best last objective among the points at or above that
+cell on every axis. That is linear in N plus the table size. When the grid
+would exceed MAX_GRID_CELLS (many objectives or wide values), it falls back to
+sort-filter-skyline: points sorted by decreasing sum, each checked only
+against the frontier found so far.
+"""
+import numpy as np
+
+# Largest suffix-max table (cells over the first d-1 objectives) built before falling back to sorting
+MAX_GRID_CELLS = 1 << 22
+# Points checked against the frontier at a time by the sorting fallback
+SORT_BLOCK_ROWS = 1024
+
+
+def _as_maximized(points, maximize):
+    """Copy of the points as int64 where every objective is maximized and starts at 0."""
+    pts = np.asarray(points).astype(np.int64).reshape(len(points), -1)
+    pts[:, ~np.asarray(maximize, dtype=bool)] *= -1
+    return pts - pts.min(axis=0)
+
+
+def _grid_skyline(pts):
+    # A leading axis fixed at 0 keeps at least one table dimension (single objective)
+    prefix = np.column_stack([np.zeros(len(pts), dtype=np.int64), pts[:, :-1]])
+    cells = tuple(prefix.T)
+    last = pts[:, -1]
+    # One extra empty (-1) cell on every axis for the neighbours of the edge cells
+    cell_max = np.full(tuple(prefix.max(axis=0) + 2), -1, dtype=np.int64)
+    np.maximum.at(cell_max, cells, last)
+
+    suffix_max = cell_max
+    for axis in range(suffix_max.ndim):
+        suffix_max = np.flip(np.maximum.accumulate(np.flip(suffix_max, axis), axis=axis), axis)
+
+    # Best last objective strictly above the point's own cell on some axis
+    above = np.full(len(pts), -1, dtype=np.int64)
+    for axis in range(suffix_max.ndim):
+        shifted = list(cells)
+        shifted[axis] = shifted[axis] + 1
+        above = np.maximum(above, suffix_max[tuple(shifted)])
+
+    dominated = (above >= last) | (cell_max[cells] > last)
+    return np.flatnonzero(~dominated)
+
+
+def _sorted_skyline(pts):
+    # A dominating point has a strictly larger sum, so it always comes first
+    order = np.argsort(-pts.sum(axis=1), kind='stable')
+    frontier = np.empty((0, pts.shape[1]), dtype=np.int64)
+    kept = []
+    for start in range(0, len(order), SORT_BLOCK_ROWS):
+        block_rows = order[start:start + SORT_BLOCK_ROWS]
+        block = pts[block_rows]
+        # Against the frontier so far, then within the block
+        for candidates in (frontier, block):
+            if not len(block):
+                break
+            dominated = np.zeros(len(block), dtype=bool)
+            for begin in range(0, len(candidates), SORT_BLOCK_ROWS):
+                others = candidates[begin:begin + SORT_BLOCK_ROWS][None, :, :]
+                ge = (others >= block[:, None, :]).all(axis=2)
+                gt = (others > block[:, None, :]).any(axis=2)
+                dominated |= (ge & gt).any(axis=1)
+            block, block_rows = block[~dominated], block_rows[~dominated]
+        frontier = np.concatenate([frontier, block])
+        kept.append(block_rows)
+    return np.sort(np.concatenate(kept)) if kept else np.empty(0, dtype=np.intp)
+
+
+def skyline(points, maximize):
+    """
+    Sorted row indices of the non-dominated rows of an (N, d) integer matrix.
+    maximize[i] tells whether higher values of column i are better.
+    """
+    if not len(points):
+        return np.empty(0, dtype=np.intp)
+    pts = _as_maximized(points, maximize)
+    grid_cells = np.prod(pts[:, :-1].max(axis=0) + 2, dtype=np.float64) if pts.shape[1] > 1 else 2
+    if grid_cells <= MAX_GRID_CELLS:
+        return _grid_skyline(pts)
+    return _sorted_skyline(pts)
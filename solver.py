@@ -1,4 +1,5 @@
-from constants import TILE_NODES, NEIGHBOURS, WEST, NORTH, EAST, SOUTH
+from constants import TILE_NODES, NEIGHBOURS, WEST, NORTH, EAST, SOUTH, CENTER_POSITION
+from analysis import build_road_fragments
 
 def update_position_domain(node_states, position, available_pieces, connections_candidates):
     
@@ -26,7 +27,8 @@ def find_valid_boards_generator(board_state, node_states, available_pieces, game
     position = min(available_positions, key=lambda i: len(domains[i]))
     
     for candidate in domains[position]:
-        uf_copy = uf_structure.copy()
+        # The union-find is shared down the tree; unions are undone from its trail
+        checkpoint = uf_structure.checkpoint()
         cycle_found = False
         (piece, side, orientation) = candidate
         
@@ -34,11 +36,12 @@ def find_valid_boards_generator(board_state, node_states, available_pieces, game
             local_conn1, local_conn2 = road['connection']
             global_id1 = TILE_NODES[position][(local_conn1 + orientation) % 4]
             global_id2 = TILE_NODES[position][(local_conn2 + orientation) % 4]
-            if uf_copy.union(global_id1, global_id2):
+            if uf_structure.union(global_id1, global_id2):
                 cycle_found = True
                 break
         
         if cycle_found:
+            uf_structure.rollback(checkpoint)
             continue
 
         board_state[position] = candidate
@@ -77,14 +80,289 @@ def find_valid_boards_generator(board_state, node_states, available_pieces, game
 
         # If a dead end is found, prunes the entire branch
         if dead_end_found:
+            uf_structure.rollback(checkpoint)
             available_pieces.add(piece)
             board_state[position] = None
             continue
 
         # Goes down a level in the tree
-        for solution, final_uf in find_valid_boards_generator(board_state, new_node_states, available_pieces, game_tiles, tile_connections, connections_candidates, uf_copy, new_domains):
+        for solution, final_uf in find_valid_boards_generator(board_state, new_node_states, available_pieces, game_tiles, tile_connections, connections_candidates, uf_structure, new_domains):
             yield solution, final_uf
 
         # Undoes the move (Backtrack)
+        uf_structure.rollback(checkpoint)
         available_pieces.add(piece)
-        board_state[position] = None
\ No newline at end of file
+        board_state[position] = None
+
+# =============================================================================
+# BITBOARD ENGINE
+# =============================================================================
+# Every (piece, side, orientation) candidate is mapped to the bit
+# piece * 8 + side * 4 + orientation of a 72-bit integer. A position's domain
+# is the OR of its legal candidates, so node states and available pieces never
+# have to be stored explicitly: placing a tile simply ANDs every open domain
+# with a precomputed mask that removes the used piece and, for orthogonal
+# neighbours, every candidate whose shared connection doesn't match.
+
+def generate_bitboard_tables(game_tiles, tile_connections):
+    """
+    Precomputes the lookup tables used by find_valid_boards_bitboard.
+
+    - 'candidates': bit index -> (piece, side, orientation)
+    - 'forward_masks': [position][bit index] -> tuple with one mask per position
+      holding the candidates still legal there once that candidate is placed
+    - 'road_fragments': [position][bit index] -> road fragments of that placement,
+      as consumed by RoadAssembler (see analysis.build_road_fragments)
+    """
+    candidates = [(piece, side, orientation) for piece in range(9) for side in range(2) for orientation in range(4)]
+    all_candidates = (1 << len(candidates)) - 1
+
+    # connection_masks[direction][value]: candidates with that connection value on that side
+    connection_masks = [[0, 0] for _ in range(4)]
+    for bit, (piece, side, orientation) in enumerate(candidates):
+        for direction in range(4):
+            connection_masks[direction][int(tile_connections[piece][side][orientation][direction])] |= 1 << bit
+
+    forward_masks = []
+    for position in range(9):
+        # For each neighbour, the side of this tile and the side of the neighbour that share a node
+        shared_sides = {}
+        for neighbour in NEIGHBOURS[position]:
+            shared_node = (set(TILE_NODES[position]) & set(TILE_NODES[neighbour])).pop()
+            shared_sides[neighbour] = (TILE_NODES[position].index(shared_node), TILE_NODES[neighbour].index(shared_node))
+
+        position_masks = []
+        for bit, (piece, side, orientation) in enumerate(candidates):
+            without_piece = all_candidates & ~(0xFF << (piece * 8))
+            masks = [without_piece] * 9
+            for neighbour, (own_side, neighbour_side) in shared_sides.items():
+                connection = int(tile_connections[piece][side][orientation][own_side])
+                masks[neighbour] &= connection_masks[neighbour_side][connection]
+            position_masks.append(tuple(masks))
+
+        forward_masks.append(position_masks)
+
+    return {
+        'candidates': candidates,
+        'all_candidates': all_candidates,
+        'forward_masks': forward_masks,
+        'road_fragments': build_road_fragments(game_tiles),
+    }
+
+
+def candidate_bit(candidate):
+    """Returns the bit index of a (piece, side, orientation) candidate."""
+    (piece, side, orientation) = candidate
+    return piece * 8 + side * 4 + orientation
+
+
+def bitboard_domains(board_state, tables):
+    """
+    Builds the bitmask domains for a partially filled board. Placed positions
+    get None, exactly like the domains list used by find_valid_boards_generator.
+    """
+    domains = [None if board_state[position] is not None else tables['all_candidates'] for position in range(9)]
+    for position in range(9):
+        if board_state[position] is None:
+            continue
+        masks = tables['forward_masks'][position][candidate_bit(board_state[position])]
+        for pos in range(9):
+            if domains[pos] is not None:
+                domains[pos] &= masks[pos]
+    return domains
+
+
+def find_valid_boards_bitboard(board_state, domains, road_assembler, tables):
+    """
+    Same search as find_valid_boards_generator (MRV + forward checking), with
+    every domain stored as a candidate bitmask. Forward checking is one AND per
+    open position, so no candidate lists are rebuilt while descending.
+
+    Roads are built by a RoadAssembler as the tiles are placed, so every
+    solution comes out with its road sequences already packed.
+    """
+    available_positions = [i for i in range(9) if domains[i] is not None]
+
+    if not available_positions:
+        yield board_state, road_assembler
+        return
+
+    # Gets the position with the smallest domain (MRV)
+    position = min(available_positions, key=lambda i: domains[i].bit_count())
+    other_positions = [i for i in available_positions if i != position]
+
+    candidates = tables['candidates']
+    forward_masks = tables['forward_masks'][position]
+    road_fragments = tables['road_fragments'][position]
+
+    domain = domains[position]
+    while domain:
+        lowest = domain & -domain
+        domain ^= lowest
+        bit = lowest.bit_length() - 1
+
+        # Forward Checking: a single AND per open position
+        masks = forward_masks[bit]
+        new_domains = [None] * 9
+        dead_end_found = False
+        for pos in other_positions:
+            updated_domain = domains[pos] & masks[pos]
+            if not updated_domain:
+                dead_end_found = True
+                break
+            new_domains[pos] = updated_domain
+
+        if dead_end_found:
+            continue
+
+        checkpoint = road_assembler.checkpoint()
+        if road_assembler.add_fragments(road_fragments[bit]):
+            road_assembler.rollback(checkpoint)
+            continue
+
+        board_state[position] = candidates[bit]
+
+        # Goes down a level in the tree
+        yield from find_valid_boards_bitboard(board_state, new_domains, road_assembler, tables)
+
+        # Undoes the move (Backtrack)
+        road_assembler.rollback(checkpoint)
+        board_state[position] = None
+
+
+def split_search_tree(board_state, domains, road_assembler, tables, depth):
+    """
+    Expands the bitboard search 'depth' levels below the given state, using
+    the same MRV order and forward checking as find_valid_boards_bitboard, and
+    yields every surviving partial board as an independent subtree:
+    (board_state, domains, road_assembler), all of them fresh copies.
+
+    Searching each yielded subtree with find_valid_boards_bitboard visits
+    exactly the solutions of the original state.
+    """
+    available_positions = [i for i in range(9) if domains[i] is not None]
+
+    if depth == 0 or not available_positions:
+        yield board_state[:], domains[:], road_assembler.copy()
+        return
+
+    position = min(available_positions, key=lambda i: domains[i].bit_count())
+    other_positions = [i for i in available_positions if i != position]
+
+    candidates = tables['candidates']
+    forward_masks = tables['forward_masks'][position]
+    road_fragments = tables['road_fragments'][position]
+
+    domain = domains[position]
+    while domain:
+        lowest = domain & -domain
+        domain ^= lowest
+        bit = lowest.bit_length() - 1
+
+        masks = forward_masks[bit]
+        new_domains = [None] * 9
+        for pos in other_positions:
+            new_domains[pos] = domains[pos] & masks[pos]
+        if not all(new_domains[pos] for pos in other_positions):
+            continue
+
+        checkpoint = road_assembler.checkpoint()
+        if road_assembler.add_fragments(road_fragments[bit]):
+            road_assembler.rollback(checkpoint)
+            continue
+
+        board_state[position] = candidates[bit]
+        yield from split_search_tree(board_state, new_domains, road_assembler, tables, depth - 1)
+
+        road_assembler.rollback(checkpoint)
+        board_state[position] = None
+
+
+# =============================================================================
+# BOARD SYMMETRY
+# =============================================================================
+# Turning the whole board a quarter turn clockwise moves the tile at
+# (row, col) to (col, 2 - row) and turns it one step further. Mirror images
+# are not symmetries: a mirrored tile is not a tile of the game.
+# Turned copies of a board are NOT collapsed by reduced runs: road stats
+# depend on the direction a road is read in, so a turned board can score
+# differently. canonical_layout only names the board they all show.
+# What reduced runs do collapse are the tiles that look the same after a
+# turn: a roadless tile in all 4 orientations and a tile with straight roads
+# in 2. Orientations that place the very same tile give layouts with the same
+# stats, so only the lowest one is searched and layout_multiplicity counts
+# the others.
+
+BOARD_ROTATION = tuple((position % 3) * 3 + (2 - position // 3) for position in range(9))
+
+def tile_rotation_periods(game_tiles):
+    """
+    Returns periods[piece][side]: the number of quarter turns (1, 2 or 4)
+    after which the tile looks the same. Orientations that differ by a
+    multiple of the period place the very same tile.
+    """
+    def signature(tile, turns):
+        return sorted(
+            (
+                tuple(sorted((c + turns) % 4 for c in road['connection'])),
+                road.get('item', ''),
+                (road['direction'] + turns) % 4 if road.get('direction', -1) != -1 else -1,
+            )
+            for road in tile.get("roads", [])
+        )
+
+    return [
+        [next(turns for turns in (1, 2, 4) if signature(tile, turns) == signature(tile, 0)) for tile in sides]
+        for sides in game_tiles
+    ]
+
+def symmetry_mask(tables, periods):
+    """Candidate bitmask with only the lowest of each set of equivalent orientations."""
+    mask = 0
+    for bit, (piece, side, orientation) in enumerate(tables['candidates']):
+        if orientation < periods[piece][side]:
+            mask |= 1 << bit
+    return mask
+
+def rotate_layout(layout, turns=1):
+    """The layout of the same board turned 'turns' quarter turns clockwise."""
+    rotated = list(layout)
+    for _ in range(turns % 4):
+        turned = [None] * 9
+        for position, (piece, side, orientation) in enumerate(rotated):
+            turned[BOARD_ROTATION[position]] = (piece, side, (orientation + 1) % 4)
+        rotated = turned
+    return rotated
+
+def canonical_layout(layout, periods):
+    """
+    Canonical form of a layout under the board rotations: every tile at its
+    lowest equivalent orientation and, of the 4 rotations, the one with the
+    lowest center tile, ties broken by the other positions in order. Layouts
+    of the same physical board, turned or not, share it. It identifies a
+    board; reduced runs don't collapse layouts with it, since a turned board
+    can score differently.
+    """
+    best = None
+    for turns in range(4):
+        normalized = tuple(
+            (piece, side, orientation % periods[piece][side])
+            for piece, side, orientation in rotate_layout(layout, turns)
+        )
+        key = (normalized[CENTER_POSITION], normalized)
+        if best is None or key < best:
+            best = key
+    return best[1]
+
+def layout_multiplicity(layout, periods):
+    """
+    Number of layouts of the full enumeration that this reduced layout stands
+    for: the product, over the tiles, of the orientations that place the same
+    tile. The center tile is left out, since main pins it to orientation 0 in
+    full runs as well.
+    """
+    multiplicity = 1
+    for position, (piece, side, _) in enumerate(layout):
+        if position != CENTER_POSITION:
+            multiplicity *= 4 // periods[piece][side]
+    return multiplicity
@@ -0,0 +1,222 @@
+# stat_matrix.py
+"""
+Memory-mapped NumPy copy of the card stats, as a lighter query backend than
+DuckDB for repeated analyses.
+
+export_stat_matrix streams a solutions (or stat tuples) Parquet file once
+into a directory of .npy files:
+
+    stats.npy         (24, N) uint8, one contiguous row per CARD_STAT_COLUMNS stat
+    multiplicity.npy  (N,) uint64, layouts each row stands for (only when the
+                      source has a 'multiplicity' column)
+    layout_codes.npy  (N,) uint64, layout_codec codes of the layouts
+    meta.json         source file, columns and row count
+
+StatMatrix opens that directory with np.load(mmap_mode='r'), so it is ready
+at once and every query streams from the page cache. Queries walk the rows in
+blocks of BLOCK_ROWS so that memory stays bounded however large N is.
+
+    python3 stat_matrix.py                  # latest tiling_solutions_N.parquet
+    python3 stat_matrix.py --stat-tuples    # latest stat_tuples_N.parquet
+"""
+import argparse
+import json
+import os
+import re
+import time
+
+import numpy as np
+import pyarrow.parquet as pq
+
+from analysis import CARD_STAT_COLUMNS, SOLUTION_STAT_COLUMNS
+from layout_codec import LAYOUT_CODE_COLUMN, encode_layouts, decode_layouts
+from utils import LAYOUT_COLUMNS, MULTIPLICITY_COLUMN, STAT_VALUES, histograms_to_percentiles
+
+SOURCE_SOLUTIONS_DIR = 'generated_solutions'
+# Rows read from Parquet, and scanned by each query step, at a time
+BLOCK_ROWS = 1 << 22
+
+STATS_FILE = "stats.npy"
+MULTIPLICITY_FILE = "multiplicity.npy"
+LAYOUT_CODES_FILE = "layout_codes.npy"
+META_FILE = "meta.json"
+
+
+def export_stat_matrix(parquet_file_path, output_dir):
+    """Writes the stat matrix of a solutions or stat tuples Parquet file into output_dir."""
+    parquet_file = pq.ParquetFile(parquet_file_path)
+    source_columns = parquet_file.schema_arrow.names
+    num_rows = parquet_file.metadata.num_rows
+    packed = LAYOUT_CODE_COLUMN in source_columns
+    weighted = MULTIPLICITY_COLUMN in source_columns
+
+    os.makedirs(output_dir, exist_ok=True)
+    stats = np.lib.format.open_memmap(os.path.join(output_dir, STATS_FILE), mode='w+', dtype=np.uint8,
+                                      shape=(len(CARD_STAT_COLUMNS), num_rows))
+    layout_codes = np.lib.format.open_memmap(os.path.join(output_dir, LAYOUT_CODES_FILE), mode='w+', dtype=np.uint64,
+                                             shape=(num_rows,))
+    multiplicity = None
+    if weighted:
+        multiplicity = np.lib.format.open_memmap(os.path.join(output_dir, MULTIPLICITY_FILE), mode='w+', dtype=np.uint64,
+                                                 shape=(num_rows,))
+
+    read_columns = CARD_STAT_COLUMNS + ([LAYOUT_CODE_COLUMN] if packed else LAYOUT_COLUMNS)
+    if weighted:
+        read_columns = read_columns + [MULTIPLICITY_COLUMN]
+
+    print(f"🚀 Exportando {num_rows:,} linhas de '{parquet_file_path}' para '{output_dir}'...")
+    start = 0
+    for batch in parquet_file.iter_batches(batch_size=BLOCK_ROWS, columns=read_columns):
+        end = start + batch.num_rows
+        for i, column in enumerate(CARD_STAT_COLUMNS):
+            stats[i, start:end] = batch.column(column).to_numpy()
+        if packed:
+            layout_codes[start:end] = batch.column(LAYOUT_CODE_COLUMN).to_numpy()
+        else:
+            layouts = np.stack([batch.column(column).to_numpy() for column in LAYOUT_COLUMNS], axis=1)
+            layout_codes[start:end] = encode_layouts(layouts)
+        if weighted:
+            multiplicity[start:end] = batch.column(MULTIPLICITY_COLUMN).to_numpy()
+        start = end
+
+    for array in (stats, layout_codes, multiplicity):
+        if array is not None:
+            array.flush()
+    with open(os.path.join(output_dir, META_FILE), 'w', encoding='utf-8') as f:
+        json.dump({'source': parquet_file_path, 'columns': CARD_STAT_COLUMNS, 'rows': num_rows, 'weighted': weighted}, f, indent=2)
+    print(f"✅ Matriz de estatísticas salva em '{output_dir}'.")
+
+
+class StatMatrix:
+    """
+    Read-only view of an exported stat matrix.
+
+    Every query takes an optional 'rows' array of row indices (e.g. from
+    filter) and otherwise runs over all rows. Counts are weighted by the
+    multiplicity column when there is one, like the DuckDB scripts.
+    """
+    def __init__(self, directory):
+        with open(os.path.join(directory, META_FILE), 'r', encoding='utf-8') as f:
+            self.meta = json.load(f)
+        self.columns = self.meta['columns']
+        self.num_rows = self.meta['rows']
+        self.stats = np.load(os.path.join(directory, STATS_FILE), mmap_mode='r')
+        self.layout_codes = np.load(os.path.join(directory, LAYOUT_CODES_FILE), mmap_mode='r')
+        self.multiplicity = None
+        if self.meta['weighted']:
+            self.multiplicity = np.load(os.path.join(directory, MULTIPLICITY_FILE), mmap_mode='r')
+        self._column_index = {column: i for i, column in enumerate(self.columns)}
+
+    def column(self, name):
+        """Memory-mapped values of one stat, one per row."""
+        return self.stats[self._column_index[name]]
+
+    def _blocks(self, rows):
+        """Yields slices (or arrays of row indices) covering the requested rows in BLOCK_ROWS steps."""
+        if rows is None:
+            for start in range(0, self.num_rows, BLOCK_ROWS):
+                yield slice(start, min(start + BLOCK_ROWS, self.num_rows))
+        else:
+            for start in range(0, len(rows), BLOCK_ROWS):
+                yield rows[start:start + BLOCK_ROWS]
+
+    def _weights(self, block):
+        return None if self.multiplicity is None else self.multiplicity[block].astype(np.float64)
+
+    def filter(self, rows=None, **conditions):
+        """
+        Row indices whose stats meet every condition, each given as
+        stat=value or stat=(low, high) with both ends included, e.g.
+        filter(total_houses=(5, 9), total_dogs=0).
+        """
+        selected = []
+        for block in self._blocks(rows):
+            mask = None
+            for name, condition in conditions.items():
+                values = self.column(name)[block]
+                low, high = condition if isinstance(condition, tuple) else (condition, condition)
+                match = (values >= low) & (values <= high)
+                mask = match if mask is None else mask & match
+            block_rows = np.arange(block.start, block.stop) if isinstance(block, slice) else block
+            selected.append(block_rows if mask is None else block_rows[mask])
+        return np.concatenate(selected) if selected else np.empty(0, dtype=np.int64)
+
+    def histogram(self, name, rows=None):
+        """Weighted count of every value (0-255) of one stat."""
+        counts = np.zeros(STAT_VALUES, dtype=np.int64)
+        column = self.column(name)
+        for block in self._blocks(rows):
+            weights = self._weights(block)
+            counts += np.bincount(column[block], weights=weights, minlength=STAT_VALUES).astype(np.int64)
+        return counts
+
+    def percentiles(self, rows=None):
+        """Same {stat: {value: percentile}} dictionary as percentiles.json."""
+        histograms = np.zeros((len(SOLUTION_STAT_COLUMNS), STAT_VALUES), dtype=np.int64)
+        for column in self.columns:
+            histograms[SOLUTION_STAT_COLUMNS.index(column)] = self.histogram(column, rows)
+        return histograms_to_percentiles(histograms)
+
+    def max_by(self, scores, rows=None):
+        """
+        Row with the highest score and that score (the first such row on ties).
+        'scores' is either a stat name, scoring each row by its value, or a
+        {stat: table} dict: each table maps the 256 values of its stat to a
+        score and a row scores the product of its tables (a card score is
+        e.g. its percentile, or 100 minus it for 'min' cards).
+        """
+        if isinstance(scores, str):
+            scores = {scores: np.arange(STAT_VALUES, dtype=np.float64)}
+        tables = {name: np.asarray(table, dtype=np.float64) for name, table in scores.items()}
+
+        best_row, best_score = None, -np.inf
+        for block in self._blocks(rows):
+            block_scores = None
+            for name, table in tables.items():
+                values = table[self.column(name)[block]]
+                block_scores = values if block_scores is None else block_scores * values
+            if block_scores is None or not len(block_scores):
+                continue
+            i = int(np.argmax(block_scores))
+            if block_scores[i] > best_score:
+                best_score = float(block_scores[i])
+                best_row = block.start + i if isinstance(block, slice) else int(block[i])
+        return best_row, best_score
+
+    def layouts(self, rows):
+        """Layouts of the given rows as an (len(rows), 27) array in LAYOUT_COLUMNS order."""
+        return decode_layouts(self.layout_codes[np.asarray(rows)])
+
+
+def find_latest_file(directory, base_name):
+    pattern = re.compile(rf"{base_name}_(\d+)\.parquet$")
+    files = [(int(m.group(1)), f) for f in os.listdir(directory) if (m := pattern.match(f))] if os.path.isdir(directory) else []
+    return os.path.join(directory, max(files)[1]) if files else None
+
+def next_matrix_dir(directory):
+    """Próximo diretório livre stat_matrix_N dentro de 'directory'."""
+    pattern = re.compile(r"stat_matrix_(\d+)$")
+    indices = [int(m.group(1)) for f in os.listdir(directory) if (m := pattern.match(f))]
+    return os.path.join(directory, f"stat_matrix_{max(indices, default=0) + 1}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Exporta as estatísticas das soluções como matriz NumPy mapeada em memória.")
+    parser.add_argument("--stat-tuples", action="store_true",
+                        help="exporta a tabela agregada mais recente (stat_tuples_N.parquet) em vez de todas as soluções")
+    args = parser.parse_args()
+
+    start_time = time.time()
+    base_name = "stat_tuples" if args.stat_tuples else "tiling_solutions"
+    parquet_file = find_latest_file(SOURCE_SOLUTIONS_DIR, base_name)
+    if not parquet_file:
+        print(f"❌ ERRO: Nenhum arquivo '{base_name}_N.parquet' encontrado em '{SOURCE_SOLUTIONS_DIR}'.")
+        return
+
+    output_dir = next_matrix_dir(SOURCE_SOLUTIONS_DIR)
+    export_stat_matrix(parquet_file, output_dir)
+    print(f"✅ Processo concluído em {(time.time() - start_time) / 60:.2f} minutos.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+# tests/test_layout_codec.py
+"""
+Layout codes (layout_codec) must round-trip every layout and fit in 46 bits,
+since packed files and the site store nothing else of the board.
+"""
+import itertools
+import os
+import sys
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from layout_codec import encode_layouts, decode_layouts, encode_layout, decode_layout, RANK_SHIFT
+
+CODE_BITS = 46
+
+
+def random_layouts(count, seed=0):
+    rng = np.random.default_rng(seed)
+    layouts = np.empty((count, 9, 3), dtype=np.uint8)
+    layouts[:, :, 0] = rng.permuted(np.tile(np.arange(9, dtype=np.uint8), (count, 1)), axis=1)
+    layouts[:, :, 1] = rng.integers(0, 2, size=(count, 9))
+    layouts[:, :, 2] = rng.integers(0, 4, size=(count, 9))
+    return layouts.reshape(count, 27)
+
+
+def test_random_layouts_round_trip():
+    layouts = random_layouts(50_000)
+    codes = encode_layouts(layouts)
+    assert codes.dtype == np.uint64
+    assert (codes < np.uint64(1 << CODE_BITS)).all()
+    np.testing.assert_array_equal(decode_layouts(codes), layouts)
+    # (N, 9, 3) input gives the same codes as (N, 27)
+    np.testing.assert_array_equal(encode_layouts(layouts.reshape(-1, 9, 3)), codes)
+
+
+def test_boundary_layouts():
+    lowest = [(piece, 0, 0) for piece in range(9)]
+    highest = [(piece, 1, 3) for piece in reversed(range(9))]
+    assert encode_layout(lowest) == 0
+    assert encode_layout(highest) == ((362880 - 1) << RANK_SHIFT) | ((1 << RANK_SHIFT) - 1)
+    assert encode_layout(highest) < 1 << CODE_BITS
+    for layout in (lowest, highest):
+        assert decode_layout(encode_layout(layout)) == layout
+
+
+def test_every_permutation_gets_its_lexicographic_rank():
+    permutations = np.array(list(itertools.permutations(range(9))), dtype=np.uint8)
+    layouts = np.zeros((len(permutations), 9, 3), dtype=np.uint8)
+    layouts[:, :, 0] = permutations
+    codes = encode_layouts(layouts)
+    np.testing.assert_array_equal(codes >> np.uint64(RANK_SHIFT), np.arange(len(permutations), dtype=np.uint64))
+    np.testing.assert_array_equal(decode_layouts(codes)[:, 0:27:3], permutations)
+
+
+def test_empty_input():
+    assert encode_layouts(np.empty((0, 27), dtype=np.uint8)).shape == (0,)
+    assert decode_layouts(np.empty(0, dtype=np.uint64)).shape == (0, 27)
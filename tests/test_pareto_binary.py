@@ -0,0 +1,81 @@
+# tests/test_pareto_binary.py
+"""
+pareto_front.bin must read back into the pareto_front.json dictionary, and
+its byte layout must stay the one docs/js/pareto_binary.js decodes.
+"""
+import os
+import struct
+import sys
+
+import numpy as np
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from layout_codec import encode_layout
+from pareto_binary import write_pareto_binary, read_pareto_binary, MAGIC, VERSION, MAX_CARDS
+
+
+def random_board(rng):
+    return [[int(piece), int(rng.integers(2)), int(rng.integers(4))] for piece in rng.permutation(9)]
+
+
+@pytest.fixture
+def pareto_library():
+    rng = np.random.default_rng(0)
+    library = {}
+    for combo_key in ("3", "3_7", "2_9_21", "25"):
+        num_cards = len(combo_key.split("_"))
+        library[combo_key] = [
+            {"scores": [int(score) for score in rng.integers(0, 101, size=num_cards)], "board": random_board(rng)}
+            for _ in range(int(rng.integers(1, 6)))
+        ]
+    library["5_6"] = []
+    return library
+
+
+def test_round_trip(pareto_library, tmp_path):
+    file_path = tmp_path / "pareto_front.bin"
+    write_pareto_binary(pareto_library, file_path)
+    restored = read_pareto_binary(file_path)
+    assert list(restored) == list(pareto_library)
+    assert restored == pareto_library
+
+
+def test_byte_layout(pareto_library, tmp_path):
+    file_path = tmp_path / "pareto_front.bin"
+    write_pareto_binary(pareto_library, file_path)
+    data = file_path.read_bytes()
+    num_boards = sum(len(solutions) for solutions in pareto_library.values())
+
+    # Header: magic, version, combinations, boards
+    assert data[:4] == MAGIC
+    assert struct.unpack_from("<III", data, 4) == (VERSION, len(pareto_library), num_boards)
+
+    # One record per combination: card count and up to MAX_CARDS cards, 0-padded
+    position = 16
+    for combo_key in pareto_library:
+        cards = [int(card) for card in combo_key.split("_")]
+        assert list(data[position:position + MAX_CARDS + 1]) == [len(cards)] + cards + [0] * (MAX_CARDS - len(cards))
+        position += MAX_CARDS + 1
+
+    offsets = struct.unpack_from(f"<{len(pareto_library) + 1}I", data, position)
+    assert offsets == tuple(np.cumsum([0] + [len(solutions) for solutions in pareto_library.values()]).tolist())
+    position += 4 * len(offsets)
+
+    # Codes start 8-byte aligned, then the scores follow board by board
+    position += -position % 8
+    solutions = [solution for entries in pareto_library.values() for solution in entries]
+    assert list(struct.unpack_from(f"<{num_boards}Q", data, position)) == [
+        encode_layout(solution["board"]) for solution in solutions
+    ]
+    position += 8 * num_boards
+    assert list(data[position:]) == [score for solution in solutions for score in solution["scores"]]
+
+
+def test_rejects_other_files(tmp_path):
+    file_path = tmp_path / "pareto_front.bin"
+    file_path.write_bytes(b"NOPE" + bytes(12))
+    with pytest.raises(ValueError):
+        read_pareto_binary(file_path)
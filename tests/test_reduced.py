@@ -0,0 +1,88 @@
+# tests/test_reduced.py
+"""
+--reduced must describe exactly the same layouts as a full run: on one
+subtree, the stat histograms weighted by multiplicity have to match the ones
+of the full enumeration.
+"""
+import json
+import os
+import sys
+
+import numpy as np
+import pyarrow.parquet as pq
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from analysis import RoadAssembler, SOLUTION_STAT_COLUMNS
+from batch_analysis import build_batch_tables
+from constants import NUM_NODES, CENTER_POSITION
+from main import generate_tile_connections
+from solver import generate_bitboard_tables, bitboard_domains, candidate_bit, find_valid_boards_bitboard
+from solver import tile_rotation_periods, symmetry_mask, layout_multiplicity, canonical_layout, rotate_layout
+from utils import SolutionWriter
+
+# Roadless center tile (looks the same in all 4 orientations) with two more
+# tiles placed, so the subtree holds tens of thousands of layouts
+SUBTREE = {CENTER_POSITION: (6, 1, 0), 1: (0, 0, 0), 3: (2, 0, 0)}
+
+
+@pytest.fixture(scope="module")
+def game():
+    with open(os.path.join(ROOT, 'game', 'tiles', 'tiles.json'), 'r', encoding='utf-8') as file:
+        game_tiles = json.load(file)
+    tables = generate_bitboard_tables(game_tiles, generate_tile_connections(game_tiles))
+    return game_tiles, tables, build_batch_tables(game_tiles), tile_rotation_periods(game_tiles)
+
+
+def enumerate_subtree(game, placed, reduced, file_path):
+    """Writes every completion of a partial board, searched the way main does, and reads it back."""
+    game_tiles, tables, batch_tables, periods = game
+    board_state = [None] * 9
+    roads = RoadAssembler(NUM_NODES)
+    for position, candidate in placed.items():
+        board_state[position] = candidate
+        roads.add_fragments(tables['road_fragments'][position][candidate_bit(candidate)])
+
+    domains = bitboard_domains(board_state, tables)
+    if reduced:
+        canonical_candidates = symmetry_mask(tables, periods)
+        domains = [domain & canonical_candidates if domain is not None else None for domain in domains]
+
+    with SolutionWriter(str(file_path), silent=True, batch_tables=batch_tables,
+                        symmetry_periods=periods if reduced else None) as writer:
+        writer.process_solutions(find_valid_boards_bitboard(board_state, domains, roads, tables), game_tiles)
+    return writer, pq.read_table(file_path)
+
+
+def weighted_histograms(table):
+    weights = table['multiplicity'].to_numpy().astype(np.int64) if 'multiplicity' in table.column_names else None
+    return np.array([
+        np.bincount(table[column].to_numpy(), weights=weights, minlength=256).astype(np.int64)
+        for column in SOLUTION_STAT_COLUMNS
+    ])
+
+
+def test_reduced_matches_full_enumeration(game, tmp_path):
+    full_writer, full = enumerate_subtree(game, SUBTREE, False, tmp_path / "full.parquet")
+    reduced_writer, reduced = enumerate_subtree(game, SUBTREE, True, tmp_path / "reduced.parquet")
+
+    assert full.num_rows > 0
+    assert reduced.num_rows < full.num_rows
+    assert reduced_writer.total_multiplicity == full.num_rows
+    np.testing.assert_array_equal(weighted_histograms(reduced), weighted_histograms(full))
+
+
+def test_layout_multiplicity_leaves_out_the_center(game):
+    periods = game[3]
+    # Roadless center, a tile with straight roads and a roadless one around it
+    layout = [(0, 0, 0), (1, 0, 0), (2, 0, 0), (3, 0, 0), (6, 1, 0), (5, 0, 0), (4, 1, 0), (7, 1, 0), (8, 1, 0)]
+    assert layout_multiplicity(layout, periods) == 2 * 4
+
+
+def test_canonical_layout_is_shared_by_board_turns(game):
+    periods = game[3]
+    layout = [(0, 0, 1), (1, 0, 3), (2, 0, 0), (3, 0, 2), (6, 1, 0), (5, 0, 1), (4, 1, 0), (7, 1, 0), (8, 1, 3)]
+    canonical = canonical_layout(layout, periods)
+    assert all(canonical_layout(rotate_layout(layout, turns), periods) == canonical for turns in range(4))
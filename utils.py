@@ -3,24 +3,31 @@ import os
 import re
 import glob
 import duckdb
-import pandas as pd
+import numpy as np
 import pyarrow as pa
 import pyarrow.parquet as pq
-from analysis import calculate_solution_stats
+from analysis import calculate_solution_stats, SOLUTION_STAT_COLUMNS, CARD_STAT_COLUMNS, RoadAssembler
+from batch_analysis import calculate_solution_stats_batch
+from layout_codec import LAYOUT_CODE_COLUMN, encode_layouts
+from constants import CENTER_POSITION
 
-def merge_parquet_files(temp_dir, final_output_path):
+def merge_parquet_files(temp_dir, final_output_path, manifest_path=None, packed=False):
     """
     Finds all temporary parquet files, merges them into a single file using DuckDB,
-    and cleans up the temporary files. This method is memory-efficient.
+    and cleans up the temporary files (and the resume manifest, if given).
+    This method is memory-efficient.
     """
     print("\nMesclando resultados de todos os workers usando DuckDB...")
     
     temp_files_pattern = os.path.join(temp_dir, "*.parquet")
 
+    # Layout codes are spread over 46 bits: Parquet v2 stores them delta-encoded,
+    # about 4 times smaller than plain 64-bit values
+    parquet_options = "FORMAT PARQUET, PARQUET_VERSION V2" if packed else "FORMAT PARQUET"
     query = f"""
         COPY (SELECT * FROM read_parquet('{temp_files_pattern}'))
         TO '{final_output_path}'
-        WITH (FORMAT PARQUET);
+        WITH ({parquet_options});
     """
     
     try:
@@ -50,6 +57,8 @@ def merge_parquet_files(temp_dir, final_output_path):
         
         for f in temp_files_list:
             os.remove(f)
+        if manifest_path and os.path.exists(manifest_path):
+            os.remove(manifest_path)
         os.rmdir(temp_dir)
         print(f"✅ Arquivos mesclados em '{final_output_path}' e arquivos temporários limpos.")
     except Exception as e:
@@ -82,40 +91,67 @@ def get_next_filename(directory, base_name="solutions", extension="parquet"):
     # Return the full path for the new file
     return os.path.join(directory, new_filename)
 
-def solution_to_flat_dict(solution):
-    """Converts a 1D list of 9 tuples into a flat dictionary for a DataFrame."""
-    flat_data = {}
-    for position in range(9):
-        # A matemática mágica para manter o nome das colunas do banco de dados intacto
-        r = position // 3
-        c = position % 3
-        
-        tile_data = solution[position]
-        
-        # Converte para int nativo para agradar o DuckDB
-        flat_data[f'piece_{r}{c}'] = int(tile_data[0])
-        flat_data[f'side_{r}{c}'] = int(tile_data[1])
-        flat_data[f'orient_{r}{c}'] = int(tile_data[2])
-        
-    return flat_data
+# Column layout of the solutions Parquet files
+LAYOUT_COLUMNS = [f"{kind}_{r}{c}" for r in range(3) for c in range(3) for kind in ("piece", "side", "orient")]
+
+# Every column is a uint8 (0-255), which is more than enough for counts.
+SOLUTIONS_SCHEMA = pa.schema([(column, pa.uint8()) for column in LAYOUT_COLUMNS + SOLUTION_STAT_COLUMNS])
+
+# Reduced runs add the number of layouts each row stands for (up to 4^3 * 2^2 = 256)
+MULTIPLICITY_COLUMN = "multiplicity"
+REDUCED_SOLUTIONS_SCHEMA = SOLUTIONS_SCHEMA.append(pa.field(MULTIPLICITY_COLUMN, pa.uint16()))
+
+# Packed files keep the whole layout in one uint64 (layout_codec) instead of 27 columns
+PACKED_SOLUTIONS_SCHEMA = pa.schema([(LAYOUT_CODE_COLUMN, pa.uint64())] + [(column, pa.uint8()) for column in SOLUTION_STAT_COLUMNS])
+PACKED_REDUCED_SOLUTIONS_SCHEMA = PACKED_SOLUTIONS_SCHEMA.append(pa.field(MULTIPLICITY_COLUMN, pa.uint16()))
 
 class SolutionWriter:
-    """Manages writing solutions to a Parquet file in chunks."""
-    def __init__(self, file_path, chunk_size=100_000, silent=False, worker_id=None):
+    """
+    Manages writing solutions to a Parquet file in chunks.
+
+    Solutions are appended straight into preallocated uint8 column buffers
+    (one row per column, so every column is contiguous) and each full chunk
+    is handed to PyArrow as a record batch built on top of those buffers.
+
+    When batch_tables (from batch_analysis.build_batch_tables) is given, only
+    the layouts are buffered and the stats of a whole chunk are computed at
+    once by calculate_solution_stats_batch right before it is written. Roads
+    that come already assembled (RoadAssembler) are buffered as well, so the
+    batch doesn't have to trace them again.
+
+    When symmetry_periods (from solver.tile_rotation_periods) is given, the
+    solutions come from a reduced run and each row also gets its
+    layout_multiplicity in the 'multiplicity' column.
+
+    When packed is True, the layout is written as a single 'layout_code'
+    column (layout_codec.encode_layouts) instead of the 27 layout columns.
+    """
+    def __init__(self, file_path, chunk_size=100_000, silent=False, worker_id=None, batch_tables=None, symmetry_periods=None, packed=False):
         self.file_path = file_path
         self.chunk_size = chunk_size
         self.silent = silent
         self.worker_id = worker_id
+        self.batch_tables = batch_tables
+        self.packed = packed
+        self.schema = PACKED_SOLUTIONS_SCHEMA if packed else SOLUTIONS_SCHEMA
+        self._stabilizer_sizes = None
+        if symmetry_periods is not None:
+            self.schema = PACKED_REDUCED_SOLUTIONS_SCHEMA if packed else REDUCED_SOLUTIONS_SCHEMA
+            # Orientations that place the same tile, per (piece, side)
+            self._stabilizer_sizes = 4 // np.array(symmetry_periods, dtype=np.uint16)
         self.writer = None
-        self._solutions_chunk = []
+        self._layout_buffer = np.empty((len(LAYOUT_COLUMNS), chunk_size), dtype=np.uint8)
+        self._stats_buffer = np.empty((len(SOLUTION_STAT_COLUMNS), chunk_size), dtype=np.uint8)
+        self._chunk_rows = 0
+        self._road_rows, self._road_lengths, self._road_keys = [], [], []
         self.total_solutions_found = 0
+        self.total_multiplicity = 0
 
     def __enter__(self):
-        # The os.remove logic is now gone. We just return self.
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        if self._solutions_chunk:
+        if self._chunk_rows:
             self._write_chunk()
         if self.writer:
             self.writer.close()
@@ -123,86 +159,224 @@ class SolutionWriter:
             print("\n-------------------------------------------")
             print(f"✅ Finished! Found and saved a total of {self.total_solutions_found} solutions.")
             print("-------------------------------------------")
-    
-    def _get_schema(self):
-        """Creates the data type schema for the DataFrame."""
-        if hasattr(self, '_schema') and self._schema:
-            return self._schema
-
-        # Define the types for all columns
-        schema = {}
-        # 1. Grid layout columns (piece, side, orient)
-        for r in range(3):
-            for c in range(3):
-                schema[f'piece_{r}{c}'] = 'uint8'
-                schema[f'side_{r}{c}'] = 'uint8'
-                schema[f'orient_{r}{c}'] = 'uint8'
-
-        # 2. Statistical columns (totals, etc.)
-        stat_keys = [
-            # Original keys
-            "total_houses", "total_ufos", "total_girls", "total_boys", "total_dogs",
-            "total_hamburgers", "total_aliens", "total_agents", "total_captured_aliens",
-            "total_curves", "total_tiles_without_roads",
-            "largest_dog_group", "largest_house_group", "largest_citizen_group",
-            "largest_safe_zone_size", "total_roads", "max_aliens_running_towards_agent",
-            "max_hamburgers_in_front_of_alien", "max_agents_on_one_road",
-            "max_aliens_on_one_road", "max_aliens_between_two_agents",
-            "total_food_chain_sets", "longest_road_size", "max_roads_of_same_length",
-            "aliens_times_ufos", "aliens_times_hamburgers", "citizen_dog_pairs"
-        ]
-        for key in stat_keys:
-             # Use a 8-bit integer (0-255), which is more than enough for counts.
-            schema[key] = 'uint8'
-
-        self._schema = schema
-        return self._schema
+
+    def _finish_chunk(self):
+        """
+        Completes the stats of the buffered chunk (when batching) and returns
+        its multiplicity column, or None outside reduced runs.
+        """
+        rows = self._chunk_rows
+        if self.batch_tables is not None:
+            layouts = self._layout_buffer[:, :rows].T.reshape(rows, 9, 3)
+            roads = (self._road_rows, self._road_lengths, self._road_keys) if self._road_rows else None
+            self._stats_buffer[:, :rows] = calculate_solution_stats_batch(layouts, self.batch_tables, roads).T
+            for values in (self._road_rows, self._road_lengths, self._road_keys):
+                values.clear()
+
+        if self._stabilizer_sizes is None:
+            return None
+        # Same value as solver.layout_multiplicity, for the whole chunk at once
+        pieces = np.delete(self._layout_buffer[0:27:3, :rows], CENTER_POSITION, axis=0)
+        sides = np.delete(self._layout_buffer[1:27:3, :rows], CENTER_POSITION, axis=0)
+        multiplicity = self._stabilizer_sizes[pieces, sides].prod(axis=0, dtype=np.uint16)
+        self.total_multiplicity += int(multiplicity.sum(dtype=np.uint64))
+        return multiplicity
 
     def _write_chunk(self):
-        """Converts the chunk to a DataFrame, applies the schema, and writes to Parquet."""
-        if not self._solutions_chunk:
+        """Wraps the filled part of the column buffers in a record batch and writes it to Parquet."""
+        if not self._chunk_rows:
             return
 
-        # 1. Convert list of dicts to a Pandas DataFrame
-        df = pd.DataFrame(self._solutions_chunk)
-
-        # 2. Get the predefined schema and apply it
-        schema = self._get_schema()
-        # Ensure all columns exist in the DataFrame before trying to set the type
-        # This handles cases where some stat columns might not be present in all chunks
-        applicable_schema = {col: dtype for col, dtype in schema.items() if col in df.columns}
-        df = df.astype(applicable_schema)
+        rows = self._chunk_rows
+        multiplicity = self._finish_chunk()
 
-        # 3. Convert the typed DataFrame to a PyArrow Table
-        table = pa.Table.from_pandas(df, preserve_index=False)
+        if self.packed:
+            columns = [pa.array(encode_layouts(self._layout_buffer[:, :rows].T))]
+        else:
+            columns = [pa.array(self._layout_buffer[i, :rows]) for i in range(len(LAYOUT_COLUMNS))]
+        columns += [pa.array(self._stats_buffer[i, :rows]) for i in range(len(SOLUTION_STAT_COLUMNS))]
+        if multiplicity is not None:
+            columns.append(pa.array(multiplicity))
+        batch = pa.RecordBatch.from_arrays(columns, schema=self.schema)
 
-        # 4. Write to Parquet file
         if self.writer is None:
-            self.writer = pq.ParquetWriter(self.file_path, table.schema)
-        self.writer.write_table(table)
+            self.writer = pq.ParquetWriter(self.file_path, self.schema)
+        # The batch is encoded before write_batch returns, so the buffers can be reused
+        self.writer.write_batch(batch)
 
         # Logging and cleanup
         log_prefix = f"[Worker #{self.worker_id}]" if self.worker_id is not None else ""
         print(f"{log_prefix} ... Wrote chunk. Total solutions for this worker: {self.total_solutions_found}")
-        self._solutions_chunk = []
+        self._chunk_rows = 0
         
     def process_solutions(self, solution_generator, game_tiles):
         """
         Consumes solutions, calculates stats, and writes the combined data to the file.
         """
+        layout_buffer = self._layout_buffer
+        stats_buffer = self._stats_buffer
+        road_rows, road_lengths, road_keys = self._road_rows, self._road_lengths, self._road_keys
+
         # Unpack the solution and the uf object
         for solution, uf_structure in solution_generator:
-            flat_solution = solution_to_flat_dict(solution)
-
-            # Pass the uf_structure to the stats calculation!
-            solution_stats = calculate_solution_stats(solution, game_tiles, uf_structure)
-            
-            # 3. Merge the two dictionaries into a single record.
-            #    This combines the grid layout with the calculated totals.
-            combined_data = {**flat_solution, **solution_stats}
-            
-            # 4. Append the complete, combined data to the chunk.
-            self._solutions_chunk.append(combined_data)
+            row = self._chunk_rows
+            layout_buffer[:, row] = [value for tile in solution for value in tile]
+
+            # Stats are computed per chunk in _write_chunk when batching
+            if self.batch_tables is None:
+                # Pass the uf_structure to the stats calculation!
+                solution_stats = calculate_solution_stats(solution, game_tiles, uf_structure)
+                stats_buffer[:, row] = [solution_stats[key] for key in SOLUTION_STAT_COLUMNS]
+            elif isinstance(uf_structure, RoadAssembler):
+                for key, length in uf_structure.roads():
+                    road_rows.append(row)
+                    road_lengths.append(length)
+                    road_keys.append(key)
+
+            self._chunk_rows += 1
             self.total_solutions_found += 1
-            if len(self._solutions_chunk) >= self.chunk_size:
-                self._write_chunk()
\ No newline at end of file
+            if self._chunk_rows >= self.chunk_size:
+                self._write_chunk()
+
+
+# Values a stat can take: every stat is stored as a uint8
+STAT_VALUES = 256
+_CARD_STAT_INDICES = [SOLUTION_STAT_COLUMNS.index(column) for column in CARD_STAT_COLUMNS]
+
+class StatsAccumulator(SolutionWriter):
+    """
+    Stats-only counterpart of SolutionWriter: solutions are buffered and
+    scored exactly the same way, but each chunk is folded into histograms
+    instead of being written.
+
+    - histograms[column, value]: solutions with that value, one row per
+      SOLUTION_STAT_COLUMNS entry
+    - stat_tuples (only with joint=True): {CARD_STAT_COLUMNS values packed
+      into bytes: [solutions, representative layout packed into bytes]}, the
+      representative being the smallest layout in LAYOUT_COLUMNS order
+
+    In reduced runs every solution counts as its multiplicity.
+    """
+    def __init__(self, chunk_size=100_000, worker_id=None, batch_tables=None, symmetry_periods=None, joint=False):
+        super().__init__(None, chunk_size, silent=True, worker_id=worker_id,
+                         batch_tables=batch_tables, symmetry_periods=symmetry_periods)
+        self.histograms = np.zeros((len(SOLUTION_STAT_COLUMNS), STAT_VALUES), dtype=np.int64)
+        self.stat_tuples = {} if joint else None
+
+    def _write_chunk(self):
+        """Adds the buffered chunk to the histograms (and stat tuples)."""
+        if not self._chunk_rows:
+            return
+
+        rows = self._chunk_rows
+        multiplicity = self._finish_chunk()
+        weights = None if multiplicity is None else multiplicity.astype(np.int64)
+        stats = self._stats_buffer[:, :rows]
+
+        for i in range(len(SOLUTION_STAT_COLUMNS)):
+            if weights is None:
+                self.histograms[i] += np.bincount(stats[i], minlength=STAT_VALUES)
+            else:
+                self.histograms[i] += np.bincount(stats[i], weights=weights, minlength=STAT_VALUES).astype(np.int64)
+
+        if self.stat_tuples is not None:
+            card_stats = np.ascontiguousarray(stats[_CARD_STAT_INDICES].T)
+            unique_rows, inverse = np.unique(card_stats, axis=0, return_inverse=True)
+            inverse = inverse.ravel()
+            counts = np.bincount(inverse, weights=weights, minlength=len(unique_rows)).astype(np.int64)
+
+            # Smallest layout of each tuple: sort by tuple, then layout, and take each group's first row
+            layouts = self._layout_buffer[:, :rows]
+            order = np.lexsort(tuple(layouts[::-1]) + (inverse,))
+            first = order[np.r_[0, np.nonzero(np.diff(inverse[order]))[0] + 1]]
+            representatives = np.ascontiguousarray(layouts[:, first].T)
+
+            stat_tuples = self.stat_tuples
+            for row, count, layout in zip(unique_rows, counts.tolist(), representatives):
+                key, layout = row.tobytes(), layout.tobytes()
+                entry = stat_tuples.get(key)
+                if entry is None:
+                    stat_tuples[key] = [count, layout]
+                else:
+                    entry[0] += count
+                    entry[1] = min(entry[1], layout)
+
+        self._chunk_rows = 0
+
+    def save(self, file_path):
+        """Saves the histograms (and stat tuples) as a .npz part for merge_stats_parts."""
+        stat_tuples = self.stat_tuples or {}
+        keys = list(stat_tuples)
+        with open(file_path, 'wb') as f:
+            np.savez(
+                f,
+                histograms=self.histograms,
+                tuple_stats=np.frombuffer(b"".join(keys), dtype=np.uint8).reshape(len(keys), len(CARD_STAT_COLUMNS)),
+                tuple_counts=np.array([stat_tuples[key][0] for key in keys], dtype=np.int64),
+                tuple_layouts=np.frombuffer(b"".join(stat_tuples[key][1] for key in keys), dtype=np.uint8).reshape(len(keys), len(LAYOUT_COLUMNS)),
+            )
+
+def merge_stats_parts(temp_dir, manifest_path=None):
+    """
+    Adds up every stats part (.npz) left by StatsAccumulator.save in temp_dir
+    and cleans up the temporary directory (and the resume manifest, if given).
+    Returns (histograms, stat_tuples), stat_tuples mapping each tuple of
+    CARD_STAT_COLUMNS values to [solutions, representative layout tuple].
+    """
+    histograms = np.zeros((len(SOLUTION_STAT_COLUMNS), STAT_VALUES), dtype=np.int64)
+    stat_tuples = {}
+    part_files = glob.glob(os.path.join(temp_dir, "*.npz"))
+    for part_file in part_files:
+        with np.load(part_file) as part:
+            histograms += part['histograms']
+            for row, count, layout in zip(part['tuple_stats'].tolist(), part['tuple_counts'].tolist(), part['tuple_layouts'].tolist()):
+                key, layout = tuple(row), tuple(layout)
+                entry = stat_tuples.get(key)
+                if entry is None:
+                    stat_tuples[key] = [count, layout]
+                else:
+                    entry[0] += count
+                    entry[1] = min(entry[1], layout)
+
+    for part_file in part_files:
+        os.remove(part_file)
+    if manifest_path and os.path.exists(manifest_path):
+        os.remove(manifest_path)
+    os.rmdir(temp_dir)
+    print(f"✅ Merged {len(part_files)} stats parts and cleaned up '{temp_dir}'.")
+    return histograms, stat_tuples
+
+def histograms_to_percentiles(histograms):
+    """
+    Turns stat histograms into the percentiles.json layout used by the site:
+    {stat: {value: percent of solutions with that value or lower}} for every
+    CARD_STAT_COLUMNS stat, listing only values that occur.
+    """
+    percentiles = {}
+    for column in CARD_STAT_COLUMNS:
+        counts = histograms[SOLUTION_STAT_COLUMNS.index(column)]
+        total = int(counts.sum())
+        cumulative = np.cumsum(counts)
+        percentiles[column] = {
+            str(value): float(cumulative[value]) * 100.0 / total
+            for value in np.nonzero(counts)[0].tolist()
+        }
+    return percentiles
+
+# Stat tuples: every distinct CARD_STAT_COLUMNS vector, how many layouts have
+# it and the smallest of them (build_stat_tuples.py writes the same table)
+STAT_TUPLES_SCHEMA = pa.schema(
+    [(column, pa.uint8()) for column in CARD_STAT_COLUMNS]
+    + [(MULTIPLICITY_COLUMN, pa.uint64())]
+    + [(column, pa.uint8()) for column in LAYOUT_COLUMNS]
+)
+
+def write_stat_tuples(stat_tuples, file_path):
+    """Writes the stat tuples returned by merge_stats_parts as a Parquet table (STAT_TUPLES_SCHEMA)."""
+    keys = sorted(stat_tuples)
+    stats = np.array(keys, dtype=np.uint8).reshape(len(keys), len(CARD_STAT_COLUMNS))
+    layouts = np.array([stat_tuples[key][1] for key in keys], dtype=np.uint8).reshape(len(keys), len(LAYOUT_COLUMNS))
+    columns = [pa.array(stats[:, i]) for i in range(len(CARD_STAT_COLUMNS))]
+    columns.append(pa.array([stat_tuples[key][0] for key in keys], type=pa.uint64()))
+    columns += [pa.array(layouts[:, i]) for i in range(len(LAYOUT_COLUMNS))]
+    pq.write_table(pa.Table.from_arrays(columns, schema=STAT_TUPLES_SCHEMA), file_path)
@@ -5,8 +5,14 @@ import os
 import re
 import duckdb
 import csv
+import multiprocessing
+import numpy as np
+from functools import lru_cache
 from itertools import combinations, combinations_with_replacement
 
+from skyline import skyline
+from utils import MULTIPLICITY_COLUMN
+
 # Funções auxiliares (a maioria inalterada)
 def find_latest_solution_file(directory, base_name="tiling_solutions", extension="parquet"):
     if not os.path.isdir(directory): return None, f"Error: Directory '{directory}' not found."
@@ -22,41 +28,76 @@ def find_latest_solution_file(directory, base_name="tiling_solutions", extension
     if latest_file_path: return latest_file_path, None
     else: return None, f"Error: No solution file matching '{base_name}_*.{extension}' found in '{directory}'."
 
-def find_undefeated_trios_sql(db_con, parquet_file, stat_keys, stat_types):
+# Projeção das estatísticas das cartas, feita uma vez e compartilhada (só leitura) pelos processos
+PROJECTION_DB_PATH = 'databases/stat_projection.duckdb'
+# Projeções distintas guardadas por processo (uma por combinação de estatísticas)
+DISTINCT_CACHE_SIZE = 64
+
+def build_stat_projection(parquet_file, stat_keys):
     """
-    OTIMIZADO e SEGURO DE MEMÓRIA: Encontra a Fronteira de Pareto usando SQL diretamente no arquivo.
+    Grava em PROJECTION_DB_PATH a tabela stat_projection: as combinações
+    distintas das estatísticas pedidas e quantos layouts têm cada uma (pela
+    coluna multiplicity, quando existe). Reaproveita a tabela de uma execução
+    anterior se o arquivo de origem (caminho, tamanho e data) e as colunas
+    forem os mesmos.
     """
-    dominance_conditions = []
-    strict_dominance_conditions = []
-    for i in range(3):
-        key = f'"{stat_keys[i]}"'
-        op = '>=' if stat_types[i] == 'max' else '<='
-        dominance_conditions.append(f"o.{key} {op} c.{key}")
-        op_strict = '>' if stat_types[i] == 'max' else '<'
-        strict_dominance_conditions.append(f"o.{key} {op_strict} c.{key}")
+    source = [os.path.abspath(parquet_file), os.path.getsize(parquet_file), os.path.getmtime(parquet_file)]
+    os.makedirs(os.path.dirname(PROJECTION_DB_PATH), exist_ok=True)
+    con = duckdb.connect(PROJECTION_DB_PATH)
+    try:
+        current = con.execute("SELECT path, size, mtime, columns FROM projection_source").fetchone()
+    except duckdb.Error:
+        current = None
+    if current and list(current[:3]) == source and set(stat_keys) <= set(current[3]):
+        print(f"⏭️ Projeção de '{parquet_file}' já está em '{PROJECTION_DB_PATH}'. Pulando.")
+        con.close()
+        return
 
-    where_clause = " AND ".join(dominance_conditions)
-    strict_where_clause = " OR ".join(strict_dominance_conditions)
+    print(f"🗜️ Criando a projeção das estatísticas de '{parquet_file}'...")
+    con.execute(f"PRAGMA threads={os.cpu_count()};")
+    columns_str = ', '.join([f'"{key}"' for key in stat_keys])
+    parquet_columns = [row[0] for row in con.execute(f"DESCRIBE SELECT * FROM read_parquet('{parquet_file}')").fetchall()]
+    layouts_sql = f'SUM("{MULTIPLICITY_COLUMN}")' if MULTIPLICITY_COLUMN in parquet_columns else 'COUNT(*)'
+    con.execute(f"""
+        CREATE OR REPLACE TABLE stat_projection AS
+        SELECT {columns_str}, {layouts_sql}::UBIGINT AS layouts
+        FROM read_parquet('{parquet_file}')
+        GROUP BY {columns_str}
+    """)
+    con.execute("CREATE OR REPLACE TABLE projection_source (path VARCHAR, size BIGINT, mtime DOUBLE, columns VARCHAR[])")
+    con.execute("INSERT INTO projection_source VALUES (?, ?, ?, ?)", source + [list(stat_keys)])
+    tuple_count = con.execute("SELECT COUNT(*) FROM stat_projection").fetchone()[0]
+    con.close()
+    print(f"✅ Projeção com {tuple_count:,} combinações distintas salva em '{PROJECTION_DB_PATH}'.")
 
+@lru_cache(maxsize=DISTINCT_CACHE_SIZE)
+def distinct_stat_tuples(db_con, stat_keys):
+    """Valores distintos das estatísticas pedidas, como matriz (tuplas, len(stat_keys)) em ordem crescente."""
     columns_str = ', '.join([f'"{key}"' for key in stat_keys])
-    
-    query = f"""
-    WITH distinct_trios AS (
+    table = db_con.execute(f"""
         SELECT DISTINCT {columns_str}
-        FROM read_parquet('{parquet_file}')
-    )
-    SELECT {columns_str}
-    FROM distinct_trios c
-    WHERE NOT EXISTS (
-        SELECT 1
-        FROM distinct_trios o
-        WHERE ({where_clause}) AND ({strict_where_clause})
-    );
+        FROM stat_projection
+        ORDER BY ALL
+    """).to_arrow_table()
+    tuples = np.column_stack([table.column(i).to_numpy() for i in range(len(stat_keys))]).astype(np.int64)
+    tuples.flags.writeable = False
+    return tuples
+
+def find_undefeated_trios(db_con, stat_keys, stat_types):
     """
-    return db_con.execute(query).fetchall()
+    Fronteira de Pareto dos trios de estatísticas: os trios distintos da
+    projeção (de distinct_stat_tuples) filtrados por skyline.
+    """
+    tuples = distinct_stat_tuples(db_con, tuple(stat_keys))
+    frontier = tuples[skyline(tuples, [stat_type == 'max' for stat_type in stat_types])]
+    return [tuple(trio) for trio in frontier.tolist()]
+
+# Grupos de adversários avaliados por vez em find_unbeatable_trio
+OPPONENT_BATCH_ROWS = 1 << 16
+# Menor janela de partidas da primeira fase (a do campeão que vai mudando)
+CHAMPION_MIN_WINDOW = 32
 
 def calculate_round_winner(match_trios, stat_types, challenger_trio):
-    # ... (código inalterado) ...
     num_players = len(match_trios)
     player_scores = {i: 0 for i in range(num_players)}
     for i in range(3):
@@ -73,66 +114,175 @@ def calculate_round_winner(match_trios, stat_types, challenger_trio):
     winner_indices = [p_idx for p_idx, score in player_scores.items() if score == max_score]
     return [match_trios[p_idx] for p_idx in winner_indices]
 
+def opponent_groups(frontier_size, num_opponents, batch_rows=OPPONENT_BATCH_ROWS):
+    """
+    Os mesmos grupos de combinations_with_replacement(range(frontier_size),
+    num_opponents), na mesma ordem, em arrays (grupos, num_opponents) de
+    cerca de batch_rows linhas. Os últimos (até 3) adversários vêm de uma
+    tabela pronta: em ordem lexicográfica, os grupos cujo primeiro índice é
+    >= a formam um bloco contíguo no fim dela.
+    """
+    tail = min(num_opponents, 3)
+    tails = np.array(list(combinations_with_replacement(range(frontier_size), tail)), dtype=np.int32).reshape(-1, tail)
+    tail_starts = np.searchsorted(tails[:, 0], np.arange(frontier_size)) if tail else np.zeros(frontier_size, dtype=np.intp)
+
+    pending, pending_rows = [], 0
+    for head in combinations_with_replacement(range(frontier_size), num_opponents - tail):
+        suffix = tails[tail_starts[head[-1]]:] if head else tails
+        chunk = np.empty((len(suffix), num_opponents), dtype=np.int32)
+        chunk[:, :len(head)] = head
+        chunk[:, len(head):] = suffix
+        pending.append(chunk)
+        pending_rows += len(chunk)
+        if pending_rows >= batch_rows:
+            yield np.concatenate(pending)
+            pending, pending_rows = [], 0
+    if pending:
+        yield np.concatenate(pending)
+
+@lru_cache(maxsize=None)
+def _earlier(num_players):
+    """[p, q, 0] verdadeiro quando q vem antes de p numa partida de num_players jogadores."""
+    return np.tri(num_players, k=-1, dtype=bool)[:, :, None]
+
+def _round_winners(sort_keys, champion, groups):
+    """
+    Versão vetorizada de calculate_round_winner para um lote de partidas
+    [champion] + grupo, com índices da fronteira. Devolve a pontuação de cada
+    jogador (partidas, jogadores) e o índice na fronteira do primeiro vencedor
+    de cada partida (o winners[0] de calculate_round_winner).
+    """
+    num_players = groups.shape[1] + 1
+    match_rows = np.empty((len(groups), num_players), dtype=groups.dtype)
+    match_rows[:, 0] = champion
+    match_rows[:, 1:] = groups
+    # Mesma ordem de (sort_value, tie_breaker): o desafiante (e cópias dele) vence os empates
+    keys = sort_keys[match_rows] + (match_rows != champion)[:, :, None]
+
+    # Posição de p em cada objetivo: quem tem chave menor, ou igual e vem antes na partida
+    key_p, key_q = keys[:, :, None, :], keys[:, None, :, :]
+    ahead = (key_q < key_p) | ((key_q == key_p) & _earlier(num_players))
+    scores = num_players * 3 - ahead.sum(axis=(2, 3))
+
+    first_winner = np.argmax(scores, axis=1)
+    return scores, match_rows[np.arange(len(groups)), first_winner]
+
 def find_unbeatable_trio(pareto_frontier, stat_types, num_players, verbose=False):
-    # ... (código inalterado) ...
+    """
+    Mesmo resultado do torneio de calculate_round_winner: o campeão começa no
+    primeiro trio da fronteira e passa ao primeiro vencedor de cada partida
+    contra os grupos de adversários, na ordem de combinations_with_replacement;
+    o campeão final é invicto se vencer sozinho todas as partidas. As partidas
+    são avaliadas em lotes de opponent_groups; na primeira fase, em janelas que
+    crescem enquanto o campeão não muda.
+    """
     if not pareto_frontier: return None
     num_opponents = num_players - 1
     if num_opponents < 0: return None
     if num_opponents == 0: return pareto_frontier[0]
-    champion = pareto_frontier[0]
-    try:
-        opponent_combos = combinations_with_replacement(pareto_frontier, num_opponents)
-        for opponent_group in opponent_combos:
-            match_trios = [champion] + list(opponent_group)
-            winners = calculate_round_winner(match_trios, stat_types, champion)
-            if not winners: return None
-            champion = winners[0]
-    except (TypeError, ValueError):
-        if verbose: print("  -> Muitas combinações, pulando.")
-        return None
-    potential_unbeatable = champion
-    try:
-        opponent_combos = combinations_with_replacement(pareto_frontier, num_opponents)
-        for opponent_group in opponent_combos:
-            match_trios = [potential_unbeatable] + list(opponent_group)
-            winners = calculate_round_winner(match_trios, stat_types, potential_unbeatable)
-            if len(winners) != 1 or winners[0] != potential_unbeatable:
-                return None
-    except (TypeError, ValueError):
-        if verbose: print("  -> Muitas combinações, pulando.")
-        return None
-    return potential_unbeatable
-
-def run_analysis_for_combo(card_combo, num_players, db_con, parquet_file):
+
+    values = np.array(pareto_frontier, dtype=np.int64)
+    # Chaves de ordenação já dobradas: o bit livre fica para o desempate
+    sort_keys = 2 * np.where([stat_type == 'max' for stat_type in stat_types], -values, values)
+
+    # Enquanto o campeão muda muito, janelas curtas; elas dobram a cada janela sem troca
+    champion, window = 0, CHAMPION_MIN_WINDOW
+    for groups in opponent_groups(len(pareto_frontier), num_opponents):
+        start = 0
+        while start < len(groups):
+            _, winners = _round_winners(sort_keys, champion, groups[start:start + window])
+            changed = np.flatnonzero(winners != champion)
+            if len(changed):
+                champion = int(winners[changed[0]])
+                start += int(changed[0]) + 1
+                window = CHAMPION_MIN_WINDOW
+            else:
+                start += len(winners)
+                window *= 2
+
+    for groups in opponent_groups(len(pareto_frontier), num_opponents):
+        scores, _ = _round_winners(sort_keys, champion, groups)
+        if np.any(scores[:, 1:].max(axis=1) >= scores[:, 0]):
+            return None
+    return pareto_frontier[champion]
+
+def run_analysis_for_combo(card_combo, player_counts, db_con):
+    """
+    Calcula a fronteira de Pareto do trio de cartas uma única vez e procura o
+    trio invicto para cada número de jogadores. Devolve {num_players: (existe, trio)}.
+    """
     card_names = [c['name'] for c in card_combo]
     stat_keys = [c['key'] for c in card_combo]
     stat_types = [c['type'] for c in card_combo]
-    print(f"Analisando: {', '.join(card_names)}")
+    # As mensagens saem juntas no fim, para não se misturarem com as de outros processos
+    log = [f"Analisando: {', '.join(card_names)}"]
 
-    pareto_frontier = find_undefeated_trios_sql(db_con, parquet_file, stat_keys, stat_types)
+    pareto_frontier = find_undefeated_trios(db_con, stat_keys, stat_types)
     
     if not pareto_frontier:
-        print("  -> Fronteira de Pareto vazia.")
-        return False, "Fronteira Vazia"
-    
-    print(f"  -> Fronteira de Pareto com {len(pareto_frontier)} trios.")
-    unbeatable_trio = find_unbeatable_trio(pareto_frontier, stat_types, num_players)
+        log.append("  -> Fronteira de Pareto vazia.")
+        print("\n".join(log))
+        return {num_players: (False, "Fronteira Vazia") for num_players in player_counts}
     
-    if unbeatable_trio:
-        print(f"  -> 🏆 ENCONTRADO: {unbeatable_trio}")
-        return True, unbeatable_trio
-    else:
-        print("  -> Nenhum trio invicto.")
-        return False, "N/A"
+    log.append(f"  -> Fronteira de Pareto com {len(pareto_frontier)} trios.")
+    results = {}
+    for num_players in player_counts:
+        unbeatable_trio = find_unbeatable_trio(pareto_frontier, stat_types, num_players)
+        if unbeatable_trio:
+            log.append(f"  -> {num_players} jogadores: 🏆 ENCONTRADO: {unbeatable_trio}")
+            results[num_players] = (True, unbeatable_trio)
+        else:
+            log.append(f"  -> {num_players} jogadores: Nenhum trio invicto.")
+            results[num_players] = (False, "N/A")
+    print("\n".join(log))
+    return results
+
+CSV_HEADER = ['Card 1 Num', 'Card 1 Name', 'Card 2 Num', 'Card 2 Name',
+              'Card 3 Num', 'Card 3 Name', 'Unbeatable Exists?', 'Unbeatable Trio']
+
+def load_completed_combos(output_filename):
+    """
+    Trios de cartas (números) já gravados num CSV de resultados. Se a última
+    linha ficou pela metade (o processo caiu no meio da escrita), ela é
+    cortada, para que as novas linhas comecem numa linha limpa.
+    """
+    if not os.path.exists(output_filename):
+        return set()
+    with open(output_filename, 'rb+') as f:
+        content = f.read()
+        if content and not content.endswith(b"\n"):
+            f.truncate(content.rfind(b"\n") + 1)
+    with open(output_filename, 'r', newline='', encoding='utf-8') as f:
+        rows = [row for row in csv.reader(f) if len(row) == len(CSV_HEADER) and row != CSV_HEADER]
+    return {(int(row[0]), int(row[2]), int(row[4])) for row in rows}
+
+def combo_numbers(card_combo):
+    return tuple(card['number'] for card in card_combo)
+
+# Conexão de cada processo de trabalho
+_worker = {}
+
+def _init_worker():
+    db_con = duckdb.connect(PROJECTION_DB_PATH, read_only=True)
+    db_con.execute("PRAGMA memory_limit='16GB';")
+    db_con.execute("PRAGMA threads=1;")
+    _worker.update(db_con=db_con)
+
+def _analyze_combo(task):
+    card_combo, player_counts = task
+    return run_analysis_for_combo(card_combo, player_counts, _worker['db_con'])
 
 def main():
-    if len(sys.argv) != 2:
-        print("Usage: python your_script_name.py <num_players>")
+    # --stat-tuples: lê a tabela agregada (stat_tuples_N.parquet, de build_stat_tuples.py)
+    use_stat_tuples = "--stat-tuples" in sys.argv[1:]
+    args = [arg for arg in sys.argv[1:] if arg != "--stat-tuples"]
+    if not args:
+        print("Usage: python verify_winner_trio.py <num_players> [<num_players> ...] [--stat-tuples]")
         sys.exit(1)
     
     try:
-        num_players = int(sys.argv[1])
-        if num_players < 2:
+        player_counts = sorted(set(int(arg) for arg in args))
+        if player_counts[0] < 2:
              print("Error: O número de jogadores deve ser no mínimo 2."); sys.exit(1)
     except ValueError:
         print("Error: O número de jogadores deve ser um inteiro."); sys.exit(1)
@@ -142,41 +292,60 @@ def main():
     except (FileNotFoundError, json.JSONDecodeError) as e:
         print(f"Erro ao carregar 'docs/data/cards.json': {e}"); sys.exit(1)
 
-    # MODIFICAÇÃO: Conecta ao DB mas NÃO carrega a tabela inteira
-    parquet_file, error = find_latest_solution_file('generated_solutions')
+    parquet_file, error = find_latest_solution_file('generated_solutions', "stat_tuples" if use_stat_tuples else "tiling_solutions")
     if error: print(error); sys.exit(1)
     
-    db_con = duckdb.connect(database=':memory:')
-    db_con.execute("PRAGMA memory_limit='16GB';") # O limite ainda é útil para consultas individuais
-    db_con.execute(f"PRAGMA threads={os.cpu_count()};")
-    
     valid_cards = [card for card in all_cards if card.get("number") != 4 and card.get("key")]
-    output_filename = f"unbeatable_analysis_results_{num_players}p.csv"
+    output_filenames = {num_players: f"unbeatable_analysis_results_{num_players}p.csv" for num_players in player_counts}
     card_combinations = list(combinations(valid_cards, 3))
     total_combos = len(card_combinations)
-    print(f"Iniciando análise para {total_combos} combinações de cartas para {num_players} jogadores.")
+    print(f"Iniciando análise para {total_combos} combinações de cartas para {', '.join(map(str, player_counts))} jogadores.")
     print(f"Arquivo Parquet a ser analisado: {parquet_file}")
-    print(f"Resultados serão salvos em: {output_filename}")
+    print(f"Resultados serão salvos em: {', '.join(output_filenames.values())}")
 
-    with open(output_filename, 'w', newline='', encoding='utf-8') as f:
-        writer = csv.writer(f)
-        writer.writerow(['Card 1 Num', 'Card 1 Name', 'Card 2 Num', 'Card 2 Name', 
-                         'Card 3 Num', 'Card 3 Name', 'Unbeatable Exists?', 'Unbeatable Trio'])
+    # Retomada: cada (trio de cartas, número de jogadores) já gravado é pulado
+    completed = {num_players: load_completed_combos(filename) for num_players, filename in output_filenames.items()}
+    tasks = []
+    for card_combo in card_combinations:
+        pending = [num_players for num_players in player_counts if combo_numbers(card_combo) not in completed[num_players]]
+        if pending:
+            tasks.append((card_combo, pending))
+    if len(tasks) < total_combos:
+        print(f"⏭️ {total_combos - len(tasks)} combinações já concluídas para todos os jogadores. Pulando.")
+    if not tasks:
+        print("\nAnálise completa! Nada a fazer.")
+        return
 
-        for i, card_combo in enumerate(card_combinations):
-            print(f"\n--- Processando Combinação {i+1}/{total_combos} ---")
-            
-            # Passa o caminho do arquivo em cada chamada
-            exists, trio = run_analysis_for_combo(card_combo, num_players, db_con, parquet_file)
-            
-            row = [card_combo[0]['number'], card_combo[0]['name'],
-                   card_combo[1]['number'], card_combo[1]['name'],
-                   card_combo[2]['number'], card_combo[2]['name'],
-                   exists, str(trio)]
-            writer.writerow(row)
+    # Uma única leitura do Parquet; cada processo abre a projeção só para leitura
+    build_stat_projection(parquet_file, list(dict.fromkeys(card['key'] for card in valid_cards)))
+
+    files = {}
+    try:
+        for num_players, filename in output_filenames.items():
+            is_new = not os.path.exists(filename) or os.path.getsize(filename) == 0
+            files[num_players] = open(filename, 'a', newline='', encoding='utf-8')
+            if is_new:
+                csv.writer(files[num_players]).writerow(CSV_HEADER)
+        writers = {num_players: csv.writer(f) for num_players, f in files.items()}
+
+        # Um trio de cartas por tarefa; cada linha é gravada e sincronizada com o disco assim que sai
+        with multiprocessing.Pool(os.cpu_count(), initializer=_init_worker) as pool:
+            results = pool.imap(_analyze_combo, tasks)
+            for i, ((card_combo, _), combo_results) in enumerate(zip(tasks, results)):
+                for num_players, (exists, trio) in combo_results.items():
+                    row = [card_combo[0]['number'], card_combo[0]['name'],
+                           card_combo[1]['number'], card_combo[1]['name'],
+                           card_combo[2]['number'], card_combo[2]['name'],
+                           exists, str(trio)]
+                    writers[num_players].writerow(row)
+                    files[num_players].flush()
+                    os.fsync(files[num_players].fileno())
+                print(f"--- Combinação {i+1}/{len(tasks)} concluída ---")
+    finally:
+        for f in files.values():
+            f.close()
             
-    db_con.close()
-    print(f"\nAnálise completa! Resultados salvos em '{output_filename}'.")
+    print(f"\nAnálise completa! Resultados salvos em '{', '.join(output_filenames.values())}'.")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()